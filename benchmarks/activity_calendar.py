@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering import time as time_features
+from mts_ml_cup.feature_engineering.calendar import ActivityCalendar
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--users", type=int, default=400_000)
+    args = parser.parse_args()
+
+    sessions = synthetic.encoded_sessions(args.rows, n_users=args.users)
+
+    start = time.perf_counter()
+    expected_period = time_features.time_period_by_user(sessions)
+    expected_days = sessions.groupby("user_id").agg(pl.col("date").n_unique().alias("time_active_days"))
+    polars_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calendar = ActivityCalendar.from_sessions(sessions)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    period = calendar.time_period()
+    stats = calendar.activity_stats()
+    features_time = time.perf_counter() - start
+
+    assert period.frame_equal(expected_period.sort("user_id"))
+    assert stats.select(["user_id", "time_active_days"]).frame_equal(expected_days.sort("user_id"))
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        start = time.perf_counter()
+        calendar.save(os.path.join(tmp_path, "calendar"))
+        ActivityCalendar.load(os.path.join(tmp_path, "calendar")).activity_stats()
+        memmap_time = time.perf_counter() - start
+
+    print(f"rows = {args.rows:,}, users = {calendar.days.shape[0]:,}, days = {calendar.n_days}")
+    print(f"bitmaps: {(calendar.days.nbytes + calendar.slots.nbytes) / 2 ** 20:.1f} MB")
+    print(f"period + active days from sessions: {polars_time:.3f}s")
+    print(f"calendar build:                     {build_time:.3f}s")
+    print(f"period + all stats from calendar:   {features_time:.3f}s")
+    print(f"save + memmap load + stats:         {memmap_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering.buckets import run_by_buckets
+from mts_ml_cup.feature_engineering.plan import FEATURES
+from mts_ml_cup.preprocessing.raw import SessionsEncoder
+from mts_ml_cup.preprocessing.urls import build_urls_dimension
+
+
+def prepare(n_rows: int, n_users: int, sessions_path: str, urls_path: str) -> None:
+    raw_sessions = synthetic.raw_sessions(n_rows, n_users=n_users)
+    mappings = synthetic.mappings(raw_sessions)
+    SessionsEncoder(**mappings)(raw_sessions).write_parquet(sessions_path)
+    build_urls_dimension(mappings["urls_mapping"]).write_parquet(urls_path)
+
+
+def measure(
+    feature_name: str,
+    sessions_path: str,
+    urls_path: str,
+    output_path: str,
+    n_buckets: Optional[int],
+    n_jobs: int,
+) -> tuple[float, int, int]:
+    feature = FEATURES[feature_name]
+    datasets = {"urls": pl.read_parquet(urls_path)}
+    start = time.perf_counter()
+    if n_buckets is None:
+        features = feature({**datasets, "sessions": pl.read_parquet(sessions_path)})
+    else:
+        features = run_by_buckets(
+            feature.func,
+            sessions_path,
+            *[datasets[name] for name in feature.inputs[1:]],
+            n_buckets=n_buckets,
+            n_jobs=n_jobs,
+            **feature.params,
+        )
+    wall_time = time.perf_counter() - start
+    features.write_parquet(output_path)
+    return (
+        wall_time,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--feature", default="usage/per-date", choices=[
+        name for name, feature in FEATURES.items() if feature.inputs[0] == "sessions"
+    ])
+    parser.add_argument("--buckets", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        sessions_path = os.path.join(tmp_path, "sessions.parquet")
+        urls_path = os.path.join(tmp_path, "urls.parquet")
+        # ru_maxrss survives fork+exec, so the parent must stay small: data is generated in a child as well
+        with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+            pool.submit(prepare, args.rows, args.users, sessions_path, urls_path).result()
+
+        print(f"rows = {args.rows:,}, feature = {args.feature}")
+        print(f"{'run':<12} {'wall':>8} {'parent rss':>12} {'max worker rss':>15}")
+        expected = None
+        for n_buckets in [None] + args.buckets:
+            output_path = os.path.join(tmp_path, f"features-{n_buckets}.parquet")
+            # every run gets a fresh process, so ru_maxrss is not shared between runs
+            with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+                wall_time, parent_rss, worker_rss = pool.submit(
+                    measure, args.feature, sessions_path, urls_path, output_path, n_buckets, args.jobs,
+                ).result()
+
+            features = pl.read_parquet(output_path).sort("user_id")
+            if expected is None:
+                expected = features
+            else:
+                assert features.columns == expected.columns, n_buckets
+                assert features.frame_equal(expected, null_equal=True), n_buckets
+
+            name = "in-memory" if n_buckets is None else f"{n_buckets} buckets"
+            print(f"{name:<12} {wall_time:>7.2f}s {parent_rss / 1024:>9.0f} MB {worker_rss / 1024:>12.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+from mts_ml_cup.modeling.catboost import CatBoostCV
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--numeric", type=int, default=50)
+    parser.add_argument("--categorical", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 2, 5])
+    args = parser.parse_args()
+
+    train = synthetic.train_dataset(args.users, n_numeric=args.numeric, n_categorical=args.categorical)
+    model_params = {"iterations": args.iterations, "random_seed": 777, "task_type": "CPU"}
+    if args.threads is not None:
+        model_params["thread_count"] = args.threads
+    pool_params = {"cat_features": [f"categorical_{i}" for i in range(args.categorical)]}
+
+    print(f"users = {args.users:,}, columns = {train.width}, iterations = {args.iterations}")
+    print(f"{'n_parallel':>10} {'wall':>8} {'mts-ml-cup metric':>18}")
+    expected = None
+    for n_parallel in args.parallel:
+        model = CatBoostCV(model_params=dict(model_params), pool_params=pool_params)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = model.fit(train, verbose=0, n_parallel=n_parallel)
+        wall_time = time.perf_counter() - start
+
+        scores = np.array([fold_metrics["mts-ml-cup metric"] for fold_metrics in metrics])
+        if expected is None:
+            expected = scores
+        # catboost on CPU does not depend on the thread count, so the folds must agree
+        assert np.allclose(scores, expected), (n_parallel, scores, expected)
+        assert len(model.models_sex_) == len(model.models_age_) == len(metrics)
+        print(f"{n_parallel:>10} {wall_time:>7.2f}s {scores.mean():>18.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import catboost as cb
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.modeling.encoding import FeaturesEncoder
+
+TARGETS = ["user_id", "age", "age_bucket", "is_male"]
+
+
+def prepare(n_users: int, n_numeric: int, n_categorical: int, n_texts: int, path: str) -> None:
+    # feature notebooks produce float64 numerics
+    (
+        synthetic.train_dataset(n_users, n_numeric=n_numeric, n_categorical=n_categorical, n_texts=n_texts)
+        .with_columns(pl.col(pl.Float32).cast(pl.Float64))
+        .write_parquet(path)
+    )
+
+
+def measure(path: str, conversion: str, pool_params: dict) -> tuple[float, int]:
+    dataset = pl.read_parquet(path)
+    if conversion == "read only":
+        return 0.0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    features = dataset.select(pl.exclude(TARGETS))
+    if conversion == "pandas":
+        data = features.to_pandas()
+    else:
+        data = FeaturesEncoder(**pool_params).fit(features)(features)
+    cb.Pool(data=data, label=dataset["is_male"].fill_null(0).to_numpy(), **pool_params)
+    return time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def check_string_cache(path: str, pool_params: dict) -> None:
+    # categorical codes under a global string cache are not dictionary positions, the encoding must not change
+    features = pl.read_parquet(path, n_rows=10_000).select(pl.exclude(TARGETS))
+    encoder = FeaturesEncoder(**pool_params).fit(features)
+    expected = encoder(features)
+    with pl.StringCache():
+        pl.Series(encoder.categories[::-1]).cast(pl.Categorical)
+        assert encoder(features).equals(expected)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500_000)
+    parser.add_argument("--numeric", type=int, default=176)
+    parser.add_argument("--categorical", type=int, default=120)
+    parser.add_argument("--texts", type=int, default=2)
+    args = parser.parse_args()
+
+    pool_params = {
+        "cat_features": [f"categorical_{i}" for i in range(args.categorical)],
+        "text_features": [f"text_{i}" for i in range(args.texts)] or None,
+    }
+    with tempfile.TemporaryDirectory() as tmp_path:
+        path = os.path.join(tmp_path, "train.parquet")
+        # every step gets a fresh process, ru_maxrss is not shared between them
+        with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+            pool.submit(prepare, args.users, args.numeric, args.categorical, args.texts, path).result()
+
+        check_string_cache(path, pool_params)
+        features = pl.scan_parquet(path).select(pl.exclude(TARGETS)).columns
+        print(f"users = {args.users:,}, features = {len(features)}")
+        print(f"{'conversion':<12} {'wall':>8} {'peak rss':>10}")
+        for conversion in ["read only", "pandas", "encoder"]:
+            with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+                wall_time, peak_rss = pool.submit(measure, path, conversion, pool_params).result()
+            print(f"{conversion:<12} {wall_time:>7.2f}s {peak_rss / 1024:>7.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
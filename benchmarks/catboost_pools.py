@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import synthetic
+from mts_ml_cup.modeling.catboost import TASKS, CatBoostCV, fold_positions
+
+
+def per_fold_pools(model: CatBoostCV, train) -> None:
+    # the previous fit: both sides of every fold are converted, train pools are quantized by catboost.fit
+    for train_idx, val_idx in model.splitter(train):
+        for task in TASKS:
+            to_pool = getattr(model, f"to_pool_{task}")
+            to_pool(train[train_idx]).quantize()
+            to_pool(train[val_idx])
+
+
+def sliced_pools(model: CatBoostCV, train, path=None) -> None:
+    pools = model.build_pools(train, path)
+    for train_idx, val_idx in model.splitter(train):
+        for task, (rows, _) in model.task_labels(train).items():
+            train_positions, val_positions = fold_positions(rows, train_idx, val_idx)
+            pools[task].slice(train_positions), pools[task].slice(val_positions)
+
+
+def timeit(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--numeric", type=int, default=50)
+    parser.add_argument("--categorical", type=int, default=120)
+    args = parser.parse_args()
+
+    train = synthetic.train_dataset(args.users, n_numeric=args.numeric, n_categorical=args.categorical)
+    model = CatBoostCV(
+        model_params={"task_type": "CPU"},
+        pool_params={"cat_features": [f"categorical_{i}" for i in range(args.categorical)]},
+    )
+    print(f"users = {args.users:,}, columns = {train.width}")
+    print(f"{'per fold':<20} {timeit(lambda: per_fold_pools(model, train)):>7.2f}s")
+    print(f"{'quantized once':<20} {timeit(lambda: sliced_pools(model, train)):>7.2f}s")
+    with tempfile.TemporaryDirectory() as tmp_path:
+        pools_path = os.path.join(tmp_path, "pools")
+        print(f"{'quantized + saved':<20} {timeit(lambda: sliced_pools(model, train, pools_path)):>7.2f}s")
+        print(f"{'loaded':<20} {timeit(lambda: sliced_pools(model, train, pools_path)):>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
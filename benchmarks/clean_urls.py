@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from benchmarks.url_cleaning import PREPROCESSORS, PROTECTED, synthetic_hosts
+from mts_ml_cup.preprocessing import urls as u
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=500_000)
+    parser.add_argument("--max-jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    hosts = synthetic_hosts(args.hosts)
+    n_jobs = sorted({1, *[2 ** i for i in range(args.max_jobs.bit_length()) if 2 ** i <= args.max_jobs], args.max_jobs})
+
+    reference = None
+    for n in n_jobs:
+        start = time.perf_counter()
+        cleaned = u.clean_urls(hosts, PREPROCESSORS["full"], PROTECTED, n_jobs=n, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference, reference_time = cleaned, elapsed
+        assert cleaned.frame_equal(reference)
+        print(f"n_jobs = {n:>3}: {elapsed:.2f}s, speedup x{reference_time / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.preprocessing.raw import SESSIONS_COLUMNS, SessionsEncoder, city_name_expr, model_name_expr
+from mts_ml_cup.utils import polars_map
+
+
+def convert_sessions_with_joins(
+    sessions: pl.DataFrame,
+    regions_mapping: dict[str, int],
+    cities_mapping: dict[str, int],
+    manufacturers_mapping: dict[str, int],
+    models_mapping: dict[str, int],
+    types_mapping: dict[str, int],
+    os_mapping: dict[str, int],
+    parts_of_day_mapping: dict[str, int],
+    urls_mapping: dict[str, int],
+) -> pl.DataFrame:
+    return (
+        sessions
+        .with_columns(
+            [
+                city_name_expr(),
+                model_name_expr(),
+                pl.col("price").cast(pl.Float32),
+                pl.col("request_cnt").cast(pl.UInt8),
+                pl.col("user_id").cast(pl.UInt32),
+            ]
+        )
+        .join(polars_map(regions_mapping, "region_name", "region_id", pl.UInt8), how="left", on="region_name")
+        .join(polars_map(cities_mapping, "city_name", "city_id", pl.UInt16), how="left", on="city_name")
+        .join(
+            polars_map(manufacturers_mapping, "cpe_manufacturer_name", "manufacturer_id", pl.UInt8),
+            how="left",
+            on="cpe_manufacturer_name",
+        )
+        .join(polars_map(models_mapping, "cpe_model_name", "model_id", pl.UInt16), how="left", on="cpe_model_name")
+        .join(polars_map(types_mapping, "cpe_type_cd", "type_id", pl.UInt8), how="left", on="cpe_type_cd")
+        .join(polars_map(os_mapping, "cpe_model_os_type", "os_id", pl.UInt8), how="left", on="cpe_model_os_type")
+        .join(
+            polars_map(parts_of_day_mapping, "part_of_day", "part_of_day_id", pl.UInt8),
+            how="left",
+            on="part_of_day",
+        )
+        .join(polars_map(urls_mapping, "url_host", "url_id", pl.UInt32), how="left", on="url_host")
+        .select(SESSIONS_COLUMNS)
+    )
+
+
+def timeit(func, n_repeats: int) -> tuple[pl.DataFrame, float]:
+    best = float("inf")
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    sessions = synthetic.raw_sessions(args.rows)
+    mappings = synthetic.mappings(sessions)
+    # leave one city unmapped to check that misses come out as nulls in both paths
+    mappings["cities_mapping"].pop(next(iter(mappings["cities_mapping"])))
+
+    joined, joins_time = timeit(lambda: convert_sessions_with_joins(sessions, **mappings), args.repeats)
+    encoder = SessionsEncoder(**mappings)
+    encoded, encoder_time = timeit(lambda: encoder(sessions), args.repeats)
+
+    assert joined.schema == encoded.schema
+    assert joined.frame_equal(encoded, null_equal=True)
+    with pl.StringCache():
+        # other categoricals fill the global cache first, so its codes are not dictionary positions
+        pl.Series(sorted(mappings["urls_mapping"], reverse=True)).cast(pl.Categorical)
+        assert encoder(sessions).frame_equal(encoded, null_equal=True)
+
+    print(f"rows = {args.rows:,}")
+    print(f"join chain:      {joins_time:.3f}s, {args.rows / joins_time:,.0f} rows/s")
+    print(f"SessionsEncoder: {encoder_time:.3f}s, {args.rows / encoder_time:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
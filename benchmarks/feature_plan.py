@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering import url
+from mts_ml_cup.feature_engineering.plan import FEATURES, Feature, FeaturePlan
+from mts_ml_cup.preprocessing.raw import SessionsEncoder, split_sessions
+from mts_ml_cup.preprocessing.urls import build_urls_dimension
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--top-n", type=int, default=20)
+    args = parser.parse_args()
+
+    raw_sessions = synthetic.raw_sessions(args.rows, n_users=args.users)
+    mappings = synthetic.mappings(raw_sessions)
+    sessions = SessionsEncoder(**mappings)(raw_sessions).sort("user_id")
+    users_device, _ = split_sessions(sessions)
+    datasets = {"sessions": sessions, "users_device": users_device, "urls": build_urls_dimension(mappings["urls_mapping"])}
+
+    # synthetic users visit fewer urls than the notebook's top-120
+    registry = {**FEATURES, "url/top-120": Feature(url.top_n_urls_by_user, ["sessions", "urls"], top_n=args.top_n)}
+
+    start = time.perf_counter()
+    eager = {name: feature(datasets) for name, feature in registry.items()}
+    eager_time = time.perf_counter() - start
+
+    plan = FeaturePlan(registry=registry)
+    for fuse in [False, True]:
+        start = time.perf_counter()
+        features = plan.collect(fuse, **datasets)
+        total_time = time.perf_counter() - start
+        for name, frame in features.items():
+            assert frame.sort("user_id").frame_equal(eager[name].sort("user_id"), null_equal=True), name
+        print(f"{fuse = }: {total_time:.3f}s")
+        for name, seconds in plan.timings_.items():
+            print(f"    {name:<24} {seconds:.3f}s")
+
+    print(f"rows = {args.rows:,}")
+    print(f"one by one: {eager_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import argparse
+import itertools as it
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.sparse as sp
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering import sparse, url
+
+
+def pairs_with_dictionary(url_ids: np.ndarray) -> sp.csr_matrix:
+    # the notebook way: every pair gets a global id, so all pairs and the dictionary live in memory at once
+    first, second = np.array(list(it.combinations(range(url_ids.shape[1]), 2))).T
+    low = np.minimum(url_ids[:, first], url_ids[:, second]).astype(np.uint64)
+    high = np.maximum(url_ids[:, first], url_ids[:, second]).astype(np.uint64)
+    valid = low != 0
+    keys = (low << np.uint64(32) | high)[valid]
+    _, pair_ids = np.unique(keys, return_inverse=True)
+    matrix = sp.csr_matrix(
+        (np.ones(len(pair_ids), dtype=np.float32), pair_ids, np.concatenate([[0], np.cumsum(valid.sum(axis=1))])),
+        shape=(len(url_ids), pair_ids.max() + 1),
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+def measure(func) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    wall_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, wall_time, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--urls", type=int, default=50_000)
+    parser.add_argument("--top-n", type=int, default=120)
+    parser.add_argument("--widths", type=int, nargs="+", default=[18, 20, 24])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1_000])
+    args = parser.parse_args()
+
+    sessions = synthetic.encoded_sessions(args.rows, n_users=args.users, n_urls=args.urls)
+    user_ids, url_ids = url.top_n_url_ids_by_user(sessions, args.top_n)
+    del sessions
+    print(f"users = {len(user_ids):,}, top_n = {args.top_n}")
+    print(f"{'run':<24} {'wall':>8} {'peak traced':>12} {'columns':>12} {'nnz':>12}")
+
+    expected, wall_time, peak = measure(lambda: pairs_with_dictionary(url_ids))
+    print(f"{'dictionary':<24} {wall_time:>7.2f}s {peak / 2**20:>9.0f} MB {expected.shape[1]:>12,} {expected.nnz:>12,}")
+
+    for width in args.widths:
+        _, matrix = sparse.hashed_url_combinations(user_ids, url_ids, n_features=2**width)
+        # every user keeps its pairs, up to collisions inside the row
+        assert (matrix.getnnz(axis=1) <= expected.getnnz(axis=1)).all()
+        for batch_size in args.batch_sizes:
+            # batches are only counted, so the peak is what one batch needs
+            nnz, wall_time, peak = measure(
+                lambda: sum(
+                    batch.nnz
+                    for _, batch in sparse.iter_hashed_url_combinations(
+                        user_ids, url_ids, n_features=2**width, batch_size=batch_size
+                    )
+                )
+            )
+            assert nnz == matrix.nnz
+            name = f"2^{width}, batch {batch_size:,}"
+            print(f"{name:<24} {wall_time:>7.2f}s {peak / 2**20:>9.0f} MB {2**width:>12,} {nnz:>12,}")
+
+
+if __name__ == "__main__":
+    main()
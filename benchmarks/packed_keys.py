@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.utils import packed_key
+
+# (groupby keys, columns whose distinct combinations are counted), as in feature_engineering.usage
+DISTINCT_COUNTS = [
+    (["user_id"], ["date", "part_of_day_id"]),
+    (["user_id"], ["date", "url_id"]),
+    (["user_id"], ["part_of_day_id", "url_id"]),
+    (["user_id"], ["date", "part_of_day_id", "url_id"]),
+    (["user_id", "date"], ["part_of_day_id", "url_id"]),
+    (["user_id", "part_of_day_id"], ["date", "url_id"]),
+    (["user_id", "url_id"], ["date", "part_of_day_id"]),
+]
+
+
+def timeit(func) -> tuple[pl.DataFrame, float]:
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    parser.add_argument("--users", type=int, default=400_000)
+    parser.add_argument("--urls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    sessions = synthetic.encoded_sessions(args.rows, n_users=args.users, n_urls=args.urls)
+    # unmapped values come out of SessionsEncoder as nulls, they must stay distinct from each other
+    sessions = sessions.with_columns(
+        [
+            pl.when(pl.col("url_id") % 97 == 0).then(None).otherwise(pl.col("url_id")).alias("url_id"),
+            pl.when(pl.col("user_id") % 89 == 0).then(None).otherwise(pl.col("part_of_day_id")).alias("part_of_day_id"),
+        ]
+    )
+    print(f"rows = {args.rows:,}")
+    print(f"{'groupby':<32} {'distinct':<36} {'struct':>8} {'packed':>8}")
+    for by, columns in DISTINCT_COUNTS:
+        expected, struct_time = timeit(
+            lambda: sessions.groupby(by).agg(pl.struct(columns).n_unique().alias("n")).sort(by)
+        )
+        packed, packed_time = timeit(
+            lambda: sessions.groupby(by).agg(packed_key(columns).n_unique().alias("n")).sort(by)
+        )
+        assert packed.frame_equal(expected)
+        # a Float64 key would merge distinct keys above 2 ** 53
+        assert sessions.head(1).select(packed_key(columns)).dtypes == [pl.UInt64]
+        print(f"{str(by):<32} {str(columns):<36} {struct_time:>7.2f}s {packed_time:>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering import usage
+from mts_ml_cup.preprocessing.raw import SessionsEncoder
+
+
+def assert_same(left: pl.DataFrame, right: pl.DataFrame) -> None:
+    assert left.schema == right.schema
+    assert left.sort("user_id").frame_equal(right.sort("user_id"), null_equal=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    raw_sessions = synthetic.raw_sessions(args.rows, n_users=args.users)
+    sessions = SessionsEncoder(**synthetic.mappings(raw_sessions))(raw_sessions)
+    del raw_sessions
+
+    start = time.perf_counter()
+    expected = [usage_stats_by_user(sessions) for usage_stats_by_user in usage.USAGE_STATS]
+    sessions_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        sessions_path = os.path.join(tmp_path, "sessions.parquet")
+        sessions.write_parquet(sessions_path)
+
+        start = time.perf_counter()
+        cube = usage.cached_session_cube(sessions_path, tmp_path)
+        cube_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        usage.cached_session_cube(sessions_path, tmp_path)
+        cached_cube_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from_cube = [usage_stats_by_user(cube) for usage_stats_by_user in usage.USAGE_STATS]
+    from_cube_time = time.perf_counter() - start
+    for left, right in zip(from_cube, expected):
+        assert_same(left, right)
+
+    start = time.perf_counter()
+    all_at_once = usage.all_usage_stats_by_user(sessions)
+    all_at_once_time = time.perf_counter() - start
+    for stats in expected:
+        assert_same(all_at_once.select(stats.columns), stats)
+
+    print(f"rows = {args.rows:,}, cube rows = {cube.height:,}")
+    print(f"from sessions, one by one:     {sessions_time:.3f}s")
+    print(f"cube build (cold cache):       {cube_time:.3f}s")
+    print(f"cube load (warm cache):        {cached_cube_time:.3f}s")
+    print(f"from cube, one by one:         {from_cube_time:.3f}s")
+    print(f"all at once, shared cube:      {all_at_once_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
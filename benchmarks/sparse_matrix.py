@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import polars as pl
+import scipy.sparse as sp
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering import sparse, url
+
+
+def user_url_matrix_with_dok(sessions: pl.DataFrame, n_columns: int) -> sp.csr_matrix:
+    # the notebook way: a python loop filling a dok_matrix cell by cell
+    cells = sessions.groupby(["user_id", "url_id"]).agg(pl.col("request_cnt").sum()).sort(["user_id", "url_id"])
+    user_ids = cells["user_id"].unique(maintain_order=True).to_list()
+    users = dict(zip(user_ids, range(len(user_ids))))
+    matrix = sp.dok_matrix((len(users), n_columns), dtype=np.float32)
+    for user_id, url_id, request_cnt in cells.iter_rows():
+        matrix[users[user_id], url_id] += request_cnt
+    return matrix.tocsr()
+
+
+def list_column_matrix_with_dok(frame: pl.DataFrame, column: str, n_columns: int) -> sp.csr_matrix:
+    matrix = sp.dok_matrix((frame.height, n_columns), dtype=np.float32)
+    for row, ids in enumerate(frame[column].to_list()):
+        for comb in ids:
+            matrix[row, comb % n_columns] += 1
+    return matrix.tocsr()
+
+
+def timeit(func) -> tuple:
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--urls", type=int, default=50_000)
+    parser.add_argument("--buckets", type=int, default=8)
+    parser.add_argument("--width", type=int, default=2**20)
+    args = parser.parse_args()
+
+    sessions = synthetic.encoded_sessions(args.rows, n_users=args.users, n_urls=args.urls)
+    n_columns = args.urls + 1
+    print(f"rows = {args.rows:,}, users = {args.users:,}")
+    print(f"{'matrix':<20} {'dok':>8} {'direct':>8} {'nnz':>12}")
+
+    expected, dok_time = timeit(lambda: user_url_matrix_with_dok(sessions, n_columns))
+    (_, matrix), direct_time = timeit(lambda: sparse.user_url_matrix(sessions, n_columns=n_columns))
+    assert (matrix != expected).nnz == 0
+    print(f"{'user x url':<20} {dok_time:>7.2f}s {direct_time:>7.2f}s {matrix.nnz:>12,}")
+
+    bigrams = url.all_urls_ngrams_as_ids(sessions, k=2)
+    column = "url_all_visited_urls_2grams_ids"
+    expected, dok_time = timeit(lambda: list_column_matrix_with_dok(bigrams, column, args.width))
+    (_, matrix), direct_time = timeit(lambda: sparse.list_column_matrix(bigrams, column, n_columns=args.width))
+    assert (matrix != expected).nnz == 0
+    print(f"{'user x 2gram':<20} {dok_time:>7.2f}s {direct_time:>7.2f}s {matrix.nnz:>12,}")
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        sessions_path = os.path.join(tmp_path, "sessions.parquet")
+        sessions.write_parquet(sessions_path)
+        (user_ids, matrix), buckets_time = timeit(
+            lambda: sparse.user_url_matrix_by_buckets(sessions_path, n_buckets=args.buckets, n_columns=n_columns)
+        )
+        assert (matrix != sparse.user_url_matrix(sessions, n_columns=n_columns)[1]).nnz == 0
+        print(f"{f'{args.buckets} buckets':<20} {'':>8} {buckets_time:>7.2f}s {matrix.nnz:>12,}")
+
+        for memmap in [False, True]:
+            path = os.path.join(tmp_path, f"matrix-{memmap}")
+            _, save_time = timeit(lambda: sparse.save_csr(path, user_ids, matrix, memmap=memmap))
+            (_, loaded), load_time = timeit(lambda: sparse.load_csr(path))
+            assert (loaded != matrix).nnz == 0
+            print(f"{'memmap' if memmap else 'npz':<20} save {save_time:.2f}s, load {load_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import datetime as dt
+
+import numpy as np
+import polars as pl
+
+PARTS_OF_DAY = ["morning", "day", "evening", "night"]
+
+
+def raw_sessions(n_rows: int, n_users: int = 100_000, n_urls: int = 50_000, seed: int = 777) -> pl.DataFrame:
+    rng = np.random.default_rng(seed)
+    users = rng.integers(0, n_users, n_rows)
+    devices = users % 500
+    manufacturers = np.array([f"manufacturer-{i}" for i in range(30)])
+    models = np.array([f"model-{i}" for i in range(500)])
+    regions = np.array([f"region-{i}" for i in range(80)])
+    cities = np.array([f"city-{i}" for i in range(1_000)])
+    urls = np.array([f"site-{i}.{['ru', 'com', 'org'][i % 3]}" for i in range(n_urls)])
+    city_ids = rng.integers(0, len(cities), n_rows)
+    return pl.DataFrame(
+        {
+            "region_name": regions[city_ids % len(regions)],
+            "city_name": cities[city_ids],
+            "cpe_manufacturer_name": manufacturers[devices % len(manufacturers)],
+            "cpe_model_name": models[devices],
+            "url_host": urls[rng.zipf(1.2, n_rows) % n_urls],
+            "cpe_type_cd": np.array(["smartphone", "tablet", "phablet"])[devices % 3],
+            "cpe_model_os_type": np.array(["Android", "iOS", "Apple iOS"])[devices % 3],
+            "price": devices * 100.0,
+            "date": pl.Series(rng.integers(0, 400, n_rows)).cast(pl.Date) + dt.timedelta(days=18_779),
+            "part_of_day": np.array(PARTS_OF_DAY)[rng.integers(0, len(PARTS_OF_DAY), n_rows)],
+            "request_cnt": rng.integers(1, 30, n_rows),
+            "user_id": users,
+        }
+    )
+
+
+def encoded_sessions(n_rows: int, n_users: int = 100_000, n_urls: int = 50_000, seed: int = 777) -> pl.DataFrame:
+    # the fact columns as convert_sessions_parts writes them, without going through strings
+    rng = np.random.default_rng(seed)
+    return pl.DataFrame(
+        {
+            "user_id": pl.Series(rng.integers(0, n_users, n_rows), dtype=pl.UInt32),
+            "date": pl.Series(rng.integers(18_779, 18_779 + 400, n_rows, dtype=np.int32)).cast(pl.Date),
+            "part_of_day_id": pl.Series(rng.integers(1, len(PARTS_OF_DAY) + 1, n_rows), dtype=pl.UInt8),
+            "url_id": pl.Series(rng.zipf(1.2, n_rows) % n_urls + 1, dtype=pl.UInt32),
+            "request_cnt": pl.Series(rng.integers(1, 30, n_rows), dtype=pl.UInt8),
+        }
+    )
+
+
+def mappings(sessions: pl.DataFrame) -> dict[str, dict[str, int]]:
+    def to_mapping(values: pl.Series) -> dict[str, int]:
+        values = sorted(values.unique().to_list())
+        return dict(zip(values, range(1, len(values) + 1)))
+
+    sessions = sessions.with_columns(
+        [
+            pl.concat_str([pl.col("region_name"), pl.col("city_name")], sep="_+_").alias("city_name"),
+            pl.concat_str([pl.col("cpe_manufacturer_name"), pl.col("cpe_model_name")], sep="_+_").alias("cpe_model_name"),
+        ]
+    )
+    return {
+        "regions_mapping": to_mapping(sessions["region_name"]),
+        "cities_mapping": to_mapping(sessions["city_name"]),
+        "manufacturers_mapping": to_mapping(sessions["cpe_manufacturer_name"]),
+        "models_mapping": to_mapping(sessions["cpe_model_name"]),
+        "types_mapping": to_mapping(sessions["cpe_type_cd"]),
+        "os_mapping": to_mapping(sessions["cpe_model_os_type"]),
+        "parts_of_day_mapping": dict(zip(PARTS_OF_DAY, range(1, len(PARTS_OF_DAY) + 1))),
+        "urls_mapping": to_mapping(sessions["url_host"]),
+    }
+
+
+def train_dataset(
+    n_users: int,
+    n_numeric: int = 20,
+    n_categorical: int = 5,
+    n_texts: int = 0,
+    n_categories: int = 100,
+    seed: int = 777,
+) -> pl.DataFrame:
+    # a features frame as the feature notebooks build it, with targets that depend on a few columns
+    rng = np.random.default_rng(seed)
+    numeric = rng.normal(size=(n_users, n_numeric)).astype(np.float32)
+    categories = rng.integers(0, n_categories, (n_users, n_categorical))
+    words = np.array([f"site-{i}.{['ru', 'com', 'org'][i % 3]}" for i in range(1_000)])
+
+    signal = numeric[:, 0] + (categories[:, 0] % 2 if n_categorical else 0) + rng.normal(scale=0.5, size=n_users)
+    is_male = pl.Series("is_male", (signal > 0.5).astype(np.int8))
+    age_bucket = pl.Series("age_bucket", np.digitize(numeric[:, 1 % n_numeric], [-1.5, -0.75, -0.25, 0.25, 0.75, 1.5]).astype(np.int8))
+    return pl.DataFrame(
+        [
+            pl.Series("user_id", np.arange(n_users), dtype=pl.UInt32),
+            is_male.set_at_idx(rng.choice(n_users, n_users // 10, replace=False), None),
+            pl.Series("age", 19 + 10 * age_bucket.to_numpy(), dtype=pl.Int8),
+            age_bucket.set_at_idx(rng.choice(n_users, n_users // 20, replace=False), None),
+        ]
+        + [pl.Series(f"numeric_{i}", numeric[:, i]) for i in range(n_numeric)]
+        + [pl.Series(f"categorical_{i}", np.char.add("category-", categories[:, i].astype(str))) for i in range(n_categorical)]
+        + [
+            pl.Series(f"text_{i}", [" ".join(words[rng.integers(0, len(words), rng.integers(5, 20))]) for _ in range(n_users)])
+            for i in range(n_texts)
+        ]
+    )
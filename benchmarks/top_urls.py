@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering import url
+
+
+def top_n_urls_with_pivot(sessions: pl.DataFrame, urls: pl.DataFrame, top_n: int) -> pl.DataFrame:
+    top_urls = (
+        sessions
+        .groupby(["user_id", "url_id"])
+        .agg(pl.col("request_cnt").sum())
+        .sort(["user_id", "request_cnt", "url_id"], descending=[False, True, False])
+        .groupby("user_id")
+        .head(top_n)
+        .join(urls.select(["url_id", "url_host"]), how="left", on="url_id")
+        .select(["user_id", "url_host"])
+        .with_columns(pl.lit(1).alias("ones"))
+        .select([pl.all().exclude("ones"), pl.col("ones").cumsum().over("user_id").alias("top_url")])
+        .select(pl.exclude("ones"))
+        .pivot(index="user_id", columns="top_url", values="url_host")
+    )
+    # when no user has top_n urls the pivot is narrower, the missing ranks are empty for everyone
+    return top_urls.select(
+        [
+            "user_id",
+            *[
+                (pl.col(str(col)) if str(col) in top_urls.columns else pl.lit(None, dtype=pl.Utf8))
+                .fill_null("")
+                .alias(f"url_top_{col}_url")
+                for col in range(1, top_n + 1)
+            ],
+        ]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--urls", type=int, default=50_000)
+    parser.add_argument("--top-n", type=int, default=120)
+    args = parser.parse_args()
+
+    sessions = synthetic.encoded_sessions(args.rows, n_users=args.users, n_urls=args.urls)
+    urls = pl.DataFrame(
+        {
+            "url_id": pl.Series(range(1, args.urls + 1), dtype=pl.UInt32),
+            "url_host": [f"site-{i}.{['ru', 'com', 'org'][i % 3]}" for i in range(1, args.urls + 1)],
+        }
+    )
+
+    start = time.perf_counter()
+    expected = top_n_urls_with_pivot(sessions, urls, args.top_n)
+    pivot_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    user_ids, url_ids = url.top_n_url_ids_by_user(sessions, args.top_n)
+    matrix_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    wide = url.top_n_urls_as_strings(user_ids, url_ids, urls)
+    adapter_time = time.perf_counter() - start
+
+    assert wide.frame_equal(expected.sort("user_id"))
+    print(f"rows = {args.rows:,}, users = {len(user_ids):,}, top_n = {args.top_n}")
+    print(f"sort + cumsum + pivot:  {pivot_time:.3f}s, {expected.estimated_size() / 2 ** 20:.1f} MB")
+    print(f"per-group top-k matrix: {matrix_time:.3f}s, {(user_ids.nbytes + url_ids.nbytes) / 2 ** 20:.1f} MB")
+    print(f"wide strings adapter:   {adapter_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import argparse
+import functools as ft
+import time
+
+import numpy as np
+import polars as pl
+
+from mts_ml_cup.preprocessing import urls as u
+
+EDGE_CASES = [
+    "",
+    "-",
+    "--a--b--",
+    ".-a",
+    "a..b",
+    "m.vk.com",
+    "xn--80ak6aa92e.com",
+    "xn--d1acpjx3f.xn--p1ai",
+    "ПРИМЕР.РФ",
+    "İstanbul.com.tr",
+    "www.a.b.c.d",
+    "s3.amazonaws.com",
+    "news-turbopages-org.turbopages.org",
+    "site-ru.cdn.ampproject.org",
+    "123.45.67.89",
+    "a",
+    # punycode: decoded by the python fallback step, invalid or mixed labels stay as they are
+    "XN--D1ACPJX3F.XN--P1AI",
+    "www.xn--80ak6aa92e.com",
+    "xn--e1afmkfd.xn--p1ai",
+    "xn--e1afmkfd-xn--p1ai.turbopages.org",
+    "xn--.ru",
+    "xn--zz",
+    "xn--80ak6aa92e-.com",
+    # www
+    "www",
+    "www.",
+    "www.www.ru",
+    "wwwvk.ru",
+    "WWW.VK.COM",
+    "www-vk-com",
+    "www.m.mobile.vk.com",
+    # protected before, during and after the other steps
+    "vk",
+    "ya.ru",
+    "YA.RU",
+    "ya-ru",
+    "www.ya.ru",
+    "a.b.c",
+    "a-b-c",
+    "a-b-c.turbopages.org",
+    "ПРИМЕР.РФ",
+]
+
+
+def synthetic_hosts(n_hosts: int, seed: int = 777) -> list[str]:
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789-.") + ["м", "я", "Ё"])
+    lengths = rng.integers(1, 40, n_hosts)
+    chars = alphabet[rng.integers(0, len(alphabet), lengths.sum())]
+    hosts = np.split(chars, np.cumsum(lengths)[:-1])
+    prefixes = np.array(["", "", "", "www.", "xn--", "m.", "WWW."])[rng.integers(0, 7, n_hosts)]
+    zones = np.array([".ru", ".com", ".org", ".turbopages.org", ".cdn.ampproject.org", ".xn--p1ai", ""])
+    return EDGE_CASES + [
+        prefix + "".join(host) + zone
+        for prefix, host, zone in zip(prefixes, hosts, zones[rng.integers(0, len(zones), n_hosts)])
+    ]
+
+
+PREPROCESSORS = {
+    "basic": [
+        u.decode_from_punycode,
+        u.lower,
+        u.replace_hyphens_with_dots,
+    ],
+    "full": [
+        u.decode_from_punycode,
+        u.lower,
+        ft.partial(u.remove_page_accelerator, accelerators=[".turbopages.org", ".cdn.ampproject.org"]),
+        u.replace_hyphens_with_dots,
+        ft.partial(u.remove_char, chars=["_", "ё"]),
+        ft.partial(u.save_only_suffix, suffixes=["amazonaws.com", "ya.ru"]),
+        ft.partial(u.save_full_entry, entries=["vk", "google"]),
+        ft.partial(u.map_url, mapping={"m.vk.com": "vk.com", "a": ""}),
+        ft.partial(u.remove_domains, domains=["www", "m", "mobile"]),
+        u.remove_first_level_domain,
+        u.remove_one_char_domains,
+        u.save_regexp,
+    ],
+}
+PROTECTED = {"vk", "ya.ru", "a.b.c", "пример.рф"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=300_000)
+    args = parser.parse_args()
+
+    hosts = pl.Series("url_host", synthetic_hosts(args.hosts))
+    for name, preprocessors in PREPROCESSORS.items():
+        for protected in [None, PROTECTED]:
+            start = time.perf_counter()
+            expected = hosts.apply(ft.partial(u.clean_url, preprocessors=preprocessors, protected=protected))
+            python_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            cleaned = u.VectorizedUrlCleaner(preprocessors, protected=protected)(hosts)
+            vectorized_time = time.perf_counter() - start
+
+            mismatches = hosts.filter(cleaned != expected)
+            assert len(mismatches) == 0, mismatches.head(10).to_list()
+            print(f"{name:>5} protected={protected is not None!s:>5}: python {python_time:.2f}s, vectorized {vectorized_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
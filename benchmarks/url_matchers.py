@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import argparse
+import functools as ft
+import time
+
+import numpy as np
+
+from benchmarks.url_cleaning import synthetic_hosts
+from mts_ml_cup.preprocessing import urls as u
+
+
+def synthetic_rules(n_rules: int, hosts: list[str], seed: int = 777) -> list[str]:
+    # half random strings that rarely match, half pieces of real hosts so that first-match order matters
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789.-"))
+    lengths = rng.integers(4, 16, n_rules - n_rules // 2)
+    chars = alphabet[rng.integers(0, len(alphabet), lengths.sum())]
+    rules = ["".join(rule) for rule in np.split(chars, np.cumsum(lengths)[:-1])]
+    for host in rng.choice(hosts, n_rules // 2):
+        start = rng.integers(0, max(len(host) - 1, 1))
+        rules.append(host[start:] if rng.random() < 0.5 else host[start:start + rng.integers(3, 10)])
+    rng.shuffle(rules)
+    return rules
+
+
+def timeit(func, hosts: list[str]) -> tuple[list[str], float]:
+    start = time.perf_counter()
+    result = [func(host) for host in hosts]
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=10_000)
+    parser.add_argument("--hosts", type=int, default=20_000)
+    args = parser.parse_args()
+
+    hosts = synthetic_hosts(args.hosts)
+    rules = synthetic_rules(args.rules, hosts)
+    cases = [
+        ("remove_page_accelerator", u.remove_page_accelerator, "accelerators", u.SuffixMatcher),
+        ("save_only_suffix", u.save_only_suffix, "suffixes", u.SuffixMatcher),
+        ("save_full_entry", u.save_full_entry, "entries", u.EntryMatcher),
+        ("remove_domains", u.remove_domains, "domains", frozenset),
+    ]
+    print(f"rules = {args.rules:,}, hosts = {len(hosts):,}")
+    for name, preprocessor, param, matcher in cases:
+        start = time.perf_counter()
+        compiled = matcher(rules)
+        build_time = time.perf_counter() - start
+
+        expected, list_time = timeit(ft.partial(preprocessor, **{param: rules}), hosts)
+        matched, matcher_time = timeit(ft.partial(preprocessor, **{param: compiled}), hosts)
+        assert expected == matched, name
+        print(
+            f"{name:>24}: list {list_time:.2f}s, {matcher.__name__} {matcher_time:.3f}s "
+            f"(+{build_time:.3f}s to build)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import polars as pl
+
+from mts_ml_cup.feature_engineering import url
+
+
+def bigrams_with_apply(sessions: pl.DataFrame, urls: pl.DataFrame) -> pl.DataFrame:
+    # the previous implementation, with zip in place of nltk.bigrams
+    return (
+        sessions
+        .groupby(["user_id", "url_id"])
+        .agg(pl.col("request_cnt").sum())
+        .join(urls.select(["url_id", "url_host"]), how="left", on="url_id")
+        .sort(["user_id", "request_cnt", "url_id"], descending=[False, True, False])
+        .groupby("user_id")
+        .agg(
+            pl.col("url_host")
+            .apply(lambda urls: " ".join("_+_".join(pair) for pair in zip(urls, urls[1:])))
+            .alias("url_all_visited_urls_2grams")
+        )
+    )
+
+
+def sessions_with_list_length(n_users: int, urls_per_user: int, n_urls: int, seed: int = 777) -> pl.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pl.DataFrame(
+        {
+            "user_id": pl.Series(np.repeat(np.arange(n_users), urls_per_user), dtype=pl.UInt32),
+            "url_id": pl.Series(
+                np.concatenate([rng.choice(n_urls, urls_per_user, replace=False) + 1 for _ in range(n_users)]),
+                dtype=pl.UInt32,
+            ),
+            "request_cnt": pl.Series(rng.integers(1, 30, n_users * urls_per_user), dtype=pl.UInt8),
+        }
+    )
+
+
+def timeit(func) -> tuple[pl.DataFrame, float]:
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1_000])
+    parser.add_argument("--urls", type=int, default=50_000)
+    args = parser.parse_args()
+
+    urls = pl.DataFrame(
+        {
+            "url_id": pl.Series(range(1, args.urls + 1), dtype=pl.UInt32),
+            "url_host": [f"site-{i}.{['ru', 'com', 'org'][i % 3]}" for i in range(1, args.urls + 1)],
+        }
+    )
+    print(f"rows = {args.rows:,}")
+    print(f"{'urls per user':>14} {'apply':>8} {'text':>8} {'ids':>8}")
+    for length in args.lengths:
+        sessions = sessions_with_list_length(args.rows // length, length, args.urls)
+        expected, apply_time = timeit(lambda: bigrams_with_apply(sessions, urls))
+        text, text_time = timeit(lambda: url.all_urls_ngrams_as_text(sessions, urls, k=2))
+        ids, ids_time = timeit(lambda: url.all_urls_ngrams_as_ids(sessions, k=2))
+
+        assert text.sort("user_id").frame_equal(expected.sort("user_id"))
+        assert (ids["url_all_visited_urls_2grams_ids"].arr.lengths() == length - 1).all()
+        print(f"{length:>14,} {apply_time:>7.2f}s {text_time:>7.2f}s {ids_time:>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering.url import urls_stats_by_user
+
+
+def urls_stats_with_apply(sessions: pl.DataFrame, urls: pl.DataFrame) -> pl.DataFrame:
+    return (
+        sessions
+        .select(["user_id", "url_id"])
+        .unique()
+        .join(urls.select(["url_id", "url_host"]), how="left", on="url_id")
+        .with_columns(
+            [
+                pl.col("url_host").str.lengths().alias("chars_in_url"),
+                pl.col("url_host").apply(lambda url: len(url.split("."))).alias("domains_in_url"),
+                pl.col("url_host").str.ends_with("turbopages.org").alias("is_yandex_turbo"),
+                pl.col("url_host").str.ends_with("cdn.ampproject.org").alias("is_google_turbo"),
+                pl.col("url_host").apply(lambda url: any(filter(lambda domain: domain == "m", url.split(".")))).alias("is_mobile"),
+            ]
+        )
+        .groupby("user_id")
+        .agg(
+            [
+                pl.col("chars_in_url").mean().alias("url_avg_chars_in_url"),
+                pl.col("domains_in_url").mean().alias("url_avg_domains_in_url"),
+                pl.col("is_yandex_turbo").mean().alias("url_yandex_turbo_share"),
+                pl.col("is_google_turbo").mean().alias("url_google_turbo_share"),
+                pl.col("is_mobile").mean().alias("url_mobile_share"),
+            ]
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=400_000)
+    parser.add_argument("--urls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    sessions = synthetic.encoded_sessions(args.rows, n_users=args.users, n_urls=args.urls)
+    urls = pl.DataFrame(
+        {
+            "url_id": pl.Series(range(1, args.urls + 1), dtype=pl.UInt32),
+            "url_host": [
+                f"{'m.' if i % 7 == 0 else ''}site-{i}.{['ru', 'com', 'turbopages.org', 'cdn.ampproject.org'][i % 4]}"
+                for i in range(1, args.urls + 1)
+            ],
+        }
+    )
+
+    start = time.perf_counter()
+    expected = urls_stats_with_apply(sessions, urls)
+    apply_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = urls_stats_by_user(sessions, urls)
+    native_time = time.perf_counter() - start
+
+    assert stats.schema == expected.schema
+    assert stats.sort("user_id").frame_equal(expected.sort("user_id"))
+    print(f"rows = {args.rows:,}, urls = {args.urls:,}")
+    print(f"apply per (user, host): {apply_time:.3f}s")
+    print(f"host attribute table:   {native_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
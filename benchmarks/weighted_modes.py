@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+import polars as pl
+
+from benchmarks import synthetic
+from mts_ml_cup.feature_engineering.modes import MODE_COLUMNS
+from mts_ml_cup.preprocessing.raw import SessionsEncoder
+from mts_ml_cup.utils import weighted_mode_by_user
+
+
+def weighted_mode_per_column(sessions: pl.DataFrame, columns: list[str], weight: str = "request_cnt") -> pl.DataFrame:
+    # the original kernel: one groupby and a global sort over the sessions per column
+    modes = [
+        sessions
+        .groupby(["user_id", col])
+        .agg(pl.col(weight).sum())
+        .sort(["user_id", weight, col])
+        .groupby("user_id")
+        .agg(
+            [
+                pl.col(col).last().alias(col),
+                (pl.col(weight).max() / pl.col(weight).sum()).alias(f"{col}_share"),
+                pl.col(col).n_unique().alias(f"{col}_n_unique"),
+            ]
+        )
+        for col in columns
+    ]
+    joined, *other_modes = modes
+    for col_modes in other_modes:
+        joined = joined.join(col_modes, how="left", on="user_id")
+    return joined
+
+
+def timeit(func) -> tuple[pl.DataFrame, float]:
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    raw_sessions = synthetic.raw_sessions(args.rows, n_users=args.users)
+    mappings = synthetic.mappings(raw_sessions)
+    # unmapped regions and cities come out as nulls, some users only have null regions
+    for name in ["regions_mapping", "cities_mapping"]:
+        for key in sorted(mappings[name])[:len(mappings[name]) // 4]:
+            mappings[name].pop(key)
+    sessions = SessionsEncoder(**mappings)(raw_sessions)
+    print(f"rows = {args.rows:,}, null regions = {sessions['region_id'].null_count():,}")
+
+    expected, per_column_time = timeit(lambda: weighted_mode_per_column(sessions, MODE_COLUMNS))
+    modes, shared_time = timeit(lambda: weighted_mode_by_user(sessions, MODE_COLUMNS))
+    assert modes.sort("user_id").frame_equal(expected.sort("user_id"), null_equal=True)
+    lazy_modes = weighted_mode_by_user(sessions.lazy(), MODE_COLUMNS).collect()
+    assert lazy_modes.sort("user_id").frame_equal(expected.sort("user_id"), null_equal=True)
+
+    print(f"sort per column:    {per_column_time:.3f}s")
+    print(f"one shared pass:    {shared_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
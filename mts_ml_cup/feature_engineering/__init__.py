@@ -1,6 +1,12 @@
+from . import buckets
+from . import calendar
 from . import device
 from . import geo
+from . import modes
+from . import plan
 from . import rosstat
+from . import sparse
+from . import store
 from . import time
 from . import url
 from . import usage
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+import polars as pl
+from tqdm import tqdm
+
+from mts_ml_cup.utils import parquet_memory_size, workers_within_budget
+
+BUCKET_FILE = re.compile(r"^bucket-\d{4}\.parquet$")
+
+
+def run_by_buckets(
+    func: Callable[..., pl.DataFrame | pl.LazyFrame],
+    sessions_path: str,
+    *args: Any,
+    n_buckets: int = 16,
+    n_jobs: int = os.cpu_count(),
+    memory_budget: Optional[int] = None,
+    **params: Any,
+) -> pl.DataFrame:
+    sources, bucket_size = bucket_sources(sessions_path, n_buckets)
+    n_workers = workers_within_budget(bucket_size, min(n_jobs, len(sources)), memory_budget)
+    with ProcessPoolExecutor(n_workers, mp_context=mp.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(run_bucket, func, path, bucket, n_buckets, args, params)
+            for path, bucket, n_buckets in sources
+        ]
+        results = [future.result() for future in tqdm(futures, desc="buckets")]
+
+    results = [(source, result) for source, result in zip(sources, results) if result is not None]
+    if not results:
+        return pl.DataFrame(schema={"user_id": pl.UInt32})
+    # a diagonal concat would turn columns missing from a bucket into nulls, so schemas must agree
+    schema = results[0][1].schema
+    for (path, bucket, _), result in results:
+        if result.schema != schema:
+            raise ValueError(
+                f"{func.__name__} gave {result.columns} for bucket {bucket} of {path} "
+                f"and {list(schema)} for another one, its columns must not depend on the data"
+            )
+    return pl.concat([result for _, result in results]).sort("user_id")
+
+
+def bucket_sources(
+    sessions_path: str,
+    n_buckets: int = 16,
+) -> tuple[list[tuple[str, Optional[int], Optional[int]]], int]:
+    sessions_path = os.path.expanduser(sessions_path)
+    buckets_paths = list_buckets(sessions_path)
+    if buckets_paths:
+        # existing partitions (e.g. from convert_sessions_parts) are used as they are
+        sources = [(path, None, None) for path in buckets_paths]
+        return sources, max(map(parquet_memory_size, buckets_paths))
+
+    files = list_parquet_files(sessions_path)
+    if os.path.isdir(sessions_path):
+        sessions_path = os.path.join(sessions_path, "*.parquet")
+    sources = [(sessions_path, bucket, n_buckets) for bucket in range(n_buckets)]
+    return sources, sum(map(parquet_memory_size, files)) // n_buckets
+
+
+def run_bucket(
+    func: Callable[..., pl.DataFrame | pl.LazyFrame],
+    path: str,
+    bucket: Optional[int],
+    n_buckets: Optional[int],
+    args: tuple[Any, ...],
+    params: dict[str, Any],
+) -> Optional[pl.DataFrame]:
+    sessions = load_bucket(path, bucket, n_buckets)
+    if sessions.height == 0:
+        return None
+    result = func(sessions, *args, **params)
+    return result.collect() if isinstance(result, pl.LazyFrame) else result
+
+
+def load_bucket(path: str, bucket: Optional[int] = None, n_buckets: Optional[int] = None) -> pl.DataFrame:
+    if bucket is None:
+        return pl.read_parquet(path)
+    return pl.scan_parquet(path).filter(pl.col("user_id") % n_buckets == bucket).collect()
+
+
+def list_buckets(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if BUCKET_FILE.match(f))
+
+
+def list_parquet_files(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".parquet"))
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+
+import numpy as np
+import polars as pl
+
+from mts_ml_cup.feature_engineering.time import time_period_from_first_last_day
+from mts_ml_cup.utils import load_arrays, save_arrays
+
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+class ActivityCalendar:
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        days: np.ndarray,
+        slots: np.ndarray,
+        start_date: dt.date,
+        n_days: int,
+        n_parts_of_day: int = 4,
+    ) -> None:
+        self.user_ids = user_ids
+        self.days = days
+        self.slots = slots
+        self.start_date = start_date
+        self.n_days = n_days
+        self.n_parts_of_day = n_parts_of_day
+
+    @classmethod
+    def from_sessions(cls, sessions: pl.DataFrame | pl.LazyFrame, n_parts_of_day: int = 4) -> ActivityCalendar:
+        activity = sessions.lazy().select(["user_id", "date", "part_of_day_id"]).collect()
+        start_date, end_date = activity["date"].min(), activity["date"].max()
+        n_days = (end_date - start_date).days + 1
+
+        user_ids = activity["user_id"].unique().sort().to_numpy()
+        user_idx = np.searchsorted(user_ids, activity["user_id"].to_numpy())
+        day = (activity["date"].to_physical().to_numpy() - (start_date - dt.date(1970, 1, 1)).days).astype(np.uint64)
+        slot = day * np.uint64(n_parts_of_day) + (activity["part_of_day_id"].to_numpy() - 1).astype(np.uint64)
+        return cls(
+            user_ids=user_ids,
+            days=to_bitmap(user_idx, day, len(user_ids), n_days),
+            slots=to_bitmap(user_idx, slot, len(user_ids), n_days * n_parts_of_day),
+            start_date=start_date,
+            n_days=n_days,
+            n_parts_of_day=n_parts_of_day,
+        )
+
+    def first_day(self) -> np.ndarray:
+        return first_bit(self.days)
+
+    def last_day(self) -> np.ndarray:
+        return last_bit(self.days)
+
+    def active_days(self) -> np.ndarray:
+        return popcount(self.days)
+
+    def active_slots(self) -> np.ndarray:
+        return popcount(self.slots)
+
+    def streaks(self) -> np.ndarray:
+        return popcount(self.days & ~shift_up(self.days))
+
+    def longest_streak(self) -> np.ndarray:
+        return longest_run(self.days)
+
+    def longest_gap(self) -> np.ndarray:
+        return longest_run(~self.days & range_mask(self.first_day(), self.last_day(), self.days.shape[1]))
+
+    def dates(self, days: np.ndarray) -> pl.Series:
+        return pl.Series(days.astype(np.int32)).cast(pl.Date) + (self.start_date - dt.date(1970, 1, 1))
+
+    def time_period(self) -> pl.DataFrame:
+        return time_period_from_first_last_day(
+            pl.DataFrame(
+                {
+                    "user_id": self.user_ids,
+                    "first_day": self.dates(self.first_day()),
+                    "last_day": self.dates(self.last_day()),
+                }
+            )
+        )
+
+    def activity_stats(self) -> pl.DataFrame:
+        first_day, last_day = self.first_day(), self.last_day()
+        streaks = self.streaks()
+        return pl.DataFrame(
+            {
+                "user_id": self.user_ids,
+                "time_active_days": self.active_days(),
+                "time_active_slots": self.active_slots(),
+                "time_active_days_share": (self.active_days() / (last_day - first_day + 1)).astype(np.float32),
+                "time_streaks": streaks,
+                "time_longest_streak": self.longest_streak(),
+                "time_gaps": streaks - 1,
+                "time_longest_gap": self.longest_gap(),
+            }
+        )
+
+    def save(self, path: str) -> None:
+        save_arrays(path, {name: getattr(self, name) for name in ["user_ids", "days", "slots"]})
+        with open(os.path.join(path, "calendar.json"), "w") as f:
+            json.dump(
+                {"start_date": str(self.start_date), "n_days": self.n_days, "n_parts_of_day": self.n_parts_of_day},
+                f,
+                indent=2,
+            )
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r") -> ActivityCalendar:
+        with open(os.path.join(path, "calendar.json")) as f:
+            meta = json.load(f)
+        user_ids, days, slots = load_arrays(path, ["user_ids", "days", "slots"], mmap_mode)
+        return cls(
+            user_ids=user_ids,
+            days=days,
+            slots=slots,
+            start_date=dt.date.fromisoformat(meta["start_date"]),
+            n_days=meta["n_days"],
+            n_parts_of_day=meta["n_parts_of_day"],
+        )
+
+
+def to_bitmap(user_idx: np.ndarray, bits: np.ndarray, n_users: int, n_bits: int) -> np.ndarray:
+    bitmap = np.zeros((n_users, (n_bits + 63) // 64), dtype=np.uint64)
+    np.bitwise_or.at(bitmap, (user_idx, bits // np.uint64(64)), np.uint64(1) << (bits % np.uint64(64)))
+    return bitmap
+
+
+def popcount(bitmap: np.ndarray) -> np.ndarray:
+    return POPCOUNT[np.ascontiguousarray(bitmap).view(np.uint8)].sum(axis=1, dtype=np.uint32)
+
+
+def shift_up(bitmap: np.ndarray) -> np.ndarray:
+    # bit i moves to bit i + 1, carrying the top bit of every word into the next one
+    carry = np.zeros_like(bitmap)
+    carry[:, 1:] = bitmap[:, :-1] >> np.uint64(63)
+    return (bitmap << np.uint64(1)) | carry
+
+
+def longest_run(bitmap: np.ndarray) -> np.ndarray:
+    lengths = np.zeros(len(bitmap), dtype=np.uint32)
+    bitmap = bitmap.copy()
+    active = bitmap.any(axis=1)
+    while active.any():
+        lengths += active
+        bitmap &= shift_up(bitmap)
+        active = bitmap.any(axis=1)
+    return lengths
+
+
+def lowest_bit(words: np.ndarray) -> np.ndarray:
+    # powers of two are exact in float64
+    return np.log2((words & (~words + np.uint64(1))).astype(np.float64)).astype(np.int64)
+
+
+def highest_bit(words: np.ndarray) -> np.ndarray:
+    # 32-bit halves are exact in float64, the whole 64-bit word is not
+    high = (words >> np.uint64(32)).astype(np.float64)
+    low = (words & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(
+        high > 0,
+        32 + np.floor(np.log2(np.maximum(high, 1))),
+        np.floor(np.log2(np.maximum(low, 1))),
+    ).astype(np.int64)
+
+
+def first_bit(bitmap: np.ndarray) -> np.ndarray:
+    word = (bitmap != 0).argmax(axis=1)
+    return word * 64 + lowest_bit(bitmap[np.arange(len(bitmap)), word])
+
+
+def last_bit(bitmap: np.ndarray) -> np.ndarray:
+    word = bitmap.shape[1] - 1 - (bitmap[:, ::-1] != 0).argmax(axis=1)
+    return word * 64 + highest_bit(bitmap[np.arange(len(bitmap)), word])
+
+
+def range_mask(first: np.ndarray, last: np.ndarray, n_words: int) -> np.ndarray:
+    # bits first..last (inclusive) set, per row
+    word_start = np.arange(n_words) * 64
+    low = np.clip(first[:, None] - word_start, 0, 64).astype(np.uint64)
+    high = np.clip(last[:, None] - word_start + 1, 0, 64).astype(np.uint64)
+    return ones_below(high) & ~ones_below(low)
+
+
+def ones_below(n_bits: np.ndarray) -> np.ndarray:
+    full = n_bits >= 64
+    return np.where(full, ~np.uint64(0), (np.uint64(1) << np.where(full, 0, n_bits).astype(np.uint64)) - np.uint64(1))
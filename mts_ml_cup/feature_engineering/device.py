@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import polars as pl
-from mts_ml_cup.utils import polars_map
+from mts_ml_cup.utils import lazy_like, polars_map
 
 PRICES = {
     55: 2899.0,  # Atlas LLC_+_G450
@@ -35,31 +35,20 @@ PRICES = {
 }
 
 
-def manufacturer_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
-    return (
-        sessions
-        .groupby(["user_id", "manufacturer_id"])
-        .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "manufacturer_id"])
-        .groupby("user_id")
-        .agg(pl.col("manufacturer_id").last().alias("device_manufacturer_id"))
-    )
+def manufacturer_by_user(users_device: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return users_device.select(["user_id", pl.col("manufacturer_id").alias("device_manufacturer_id")])
 
 
-def model_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
-    return (
-        sessions
-        .groupby(["user_id", "model_id"])
-        .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "model_id"])
-        .groupby("user_id")
-        .agg(pl.col("model_id").last().alias("device_model_id"))
-    )
+def model_by_user(users_device: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return users_device.select(["user_id", pl.col("model_id").alias("device_model_id")])
 
 
-def price_by_model(sessions: pl.DataFrame, prices: dict[int, float] = PRICES) -> pl.DataFrame:
+def price_by_model(
+    users_device: pl.DataFrame | pl.LazyFrame,
+    prices: dict[int, float] = PRICES,
+) -> pl.DataFrame | pl.LazyFrame:
     model_prices = (
-        sessions
+        users_device
         .select(["model_id", "manufacturer_id", "price"])
         .unique()
         .groupby(["manufacturer_id", "model_id"])
@@ -78,8 +67,11 @@ def price_by_model(sessions: pl.DataFrame, prices: dict[int, float] = PRICES) ->
     return (
         model_prices
         .join(
-            other=polars_map(prices, key_name="model_id", id_name="price", id_dtype=pl.Float32)
+            other=lazy_like(
+                polars_map(prices, key_name="model_id", id_name="price", id_dtype=pl.Float32)
                 .with_columns(pl.col("model_id").cast(pl.UInt16)),
+                users_device,
+            ),
             how="left",
             on="model_id",
         )
@@ -92,23 +84,20 @@ def price_by_model(sessions: pl.DataFrame, prices: dict[int, float] = PRICES) ->
     )
 
 
-def os_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
+def price_by_user(
+    users_device: pl.DataFrame | pl.LazyFrame,
+    prices: dict[int, float] = PRICES,
+) -> pl.DataFrame | pl.LazyFrame:
     return (
-        sessions
-        .groupby(["user_id", "os_id"])
-        .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "os_id"])
-        .groupby("user_id")
-        .agg(pl.col("os_id").last().alias("device_os_id"))
+        model_by_user(users_device)
+        .join(price_by_model(users_device, prices), how="left", on="device_model_id")
+        .select(pl.exclude("device_model_id"))
     )
 
 
-def type_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
-    return (
-        sessions
-        .groupby(["user_id", "type_id"])
-        .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "type_id"])
-        .groupby("user_id")
-        .agg(pl.col("type_id").last().alias("device_type_id"))
-    )
+def os_by_user(users_device: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return users_device.select(["user_id", pl.col("os_id").alias("device_os_id")])
+
+
+def type_by_user(users_device: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return users_device.select(["user_id", pl.col("type_id").alias("device_type_id")])
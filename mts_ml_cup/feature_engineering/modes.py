@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+import polars as pl
+
+from mts_ml_cup.feature_engineering import geo, time
+from mts_ml_cup.utils import weighted_mode_by_user
+
+MODE_COLUMNS = ["region_id", "city_id", "part_of_day_id"]
+
+
+def top_categories_by_user(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    # region, city and part of day stats from one pass over the sessions
+    return (
+        weighted_mode_by_user(sessions, MODE_COLUMNS)
+        .select(["user_id"] + geo.region_stats_exprs() + geo.city_stats_exprs() + time.top_part_of_day_exprs())
+    )
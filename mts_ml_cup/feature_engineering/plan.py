@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+import polars as pl
+
+from mts_ml_cup.feature_engineering import device, modes, time, url, usage
+from mts_ml_cup.utils import scan_dataset
+
+FUSED = "fused"
+COLLECTED = "collected"
+
+
+class Feature:
+    def __init__(
+        self,
+        func: Callable[..., pl.DataFrame | pl.LazyFrame],
+        inputs: Optional[list[str]] = None,
+        **params: Any,
+    ) -> None:
+        self.func = func
+        self.inputs = inputs if inputs is not None else ["sessions"]
+        self.params = params
+
+    def __call__(self, datasets: dict[str, pl.LazyFrame]) -> pl.DataFrame | pl.LazyFrame:
+        return self.func(*[datasets[name] for name in self.inputs], **self.params)
+
+
+FEATURES = {
+    "device/manufacturer": Feature(device.manufacturer_by_user, ["users_device"]),
+    "device/os": Feature(device.os_by_user, ["users_device"]),
+    "device/model": Feature(device.model_by_user, ["users_device"]),
+    "device/price": Feature(device.price_by_user, ["users_device"]),
+    "device/type": Feature(device.type_by_user, ["users_device"]),
+    "modes/top-categories": Feature(modes.top_categories_by_user),
+    "url/stats": Feature(url.urls_stats_by_user, ["sessions", "urls"]),
+    "url/top-120": Feature(url.top_n_urls_by_user, ["sessions", "urls"], top_n=120),
+    "url/all": Feature(url.all_urls_by_user_as_text, ["sessions", "urls"]),
+    "url/2grams": Feature(url.all_urls_ngrams_as_text, ["sessions", "urls"], k=2),
+    "time/period": Feature(time.time_period_by_user),
+    "time/part-of-day-dist": Feature(time.part_of_day_distribution_by_user),
+    "usage/total": Feature(usage.total_usage_stats_by_user),
+    "usage/per-date": Feature(usage.usage_stats_per_date),
+    "usage/per-part-of-day": Feature(usage.usage_stats_per_part_of_day),
+    "usage/per-url": Feature(usage.usage_stats_per_url),
+    "usage/per-session": Feature(usage.usage_stats_per_session),
+    "usage/per-daily-visit": Feature(usage.usage_stats_per_daily_visit),
+    "usage/per-partly-visit": Feature(usage.usage_stats_per_partly_visit),
+    "usage/per-visit": Feature(usage.usage_stats_per_visit),
+}
+
+
+class FeaturePlan:
+    def __init__(
+        self,
+        features: Optional[list[str]] = None,
+        registry: Optional[dict[str, Feature]] = None,
+    ) -> None:
+        self.registry = registry if registry is not None else FEATURES
+        self.features = features if features is not None else list(self.registry)
+
+    def build(self, **datasets: str | pl.DataFrame | pl.LazyFrame) -> dict[str, pl.DataFrame | pl.LazyFrame]:
+        datasets = {name: as_lazy(data) for name, data in datasets.items()}
+        self.timings_ = {}
+        plans = {}
+        for name in self.features:
+            # features with eager-only steps (pivot) are computed right here
+            start = perf_counter()
+            plans[name] = self.registry[name](datasets)
+            self.timings_[name] = perf_counter() - start
+        return plans
+
+    def collect(
+        self,
+        fuse: bool = False,
+        timed: bool = False,
+        **datasets: str | pl.DataFrame | pl.LazyFrame,
+    ) -> dict[str, pl.DataFrame]:
+        # collect_all and a fused query are only timed as a whole, per-feature timings need a collect per feature
+        plans = self.build(**datasets)
+        lazy_plans = {name: plan for name, plan in plans.items() if isinstance(plan, pl.LazyFrame)}
+        if timed:
+            for name, plan in lazy_plans.items():
+                start = perf_counter()
+                plans[name] = plan.collect()
+                self.timings_[name] += perf_counter() - start
+        elif fuse and lazy_plans:
+            fused = self.fuse({name: plan.with_columns(pl.lit(True).alias(marker(name))) for name, plan in lazy_plans.items()})
+            for name, plan in lazy_plans.items():
+                plans[name] = fused.filter(pl.col(marker(name))).select(plan.columns)
+                del self.timings_[name]
+        elif lazy_plans:
+            start = perf_counter()
+            collected = pl.collect_all(list(lazy_plans.values()))
+            self.timings_[COLLECTED] = perf_counter() - start
+            for name, features in zip(lazy_plans, collected):
+                plans[name] = features
+                del self.timings_[name]
+        return plans
+
+    def collect_joined(self, **datasets: str | pl.DataFrame | pl.LazyFrame) -> pl.DataFrame:
+        return self.fuse({name: plan.lazy() for name, plan in self.build(**datasets).items()})
+
+    def write(
+        self,
+        output_path: str,
+        fuse: bool = False,
+        timed: bool = False,
+        **datasets: str | pl.DataFrame | pl.LazyFrame,
+    ) -> list[str]:
+        paths = []
+        for name, features in self.collect(fuse, timed, **datasets).items():
+            path = os.path.join(output_path, f"{name}.pq")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            features.write_parquet(path)
+            paths.append(path)
+        return paths
+
+    def fuse(self, plans: dict[str, pl.LazyFrame]) -> pl.DataFrame:
+        # one outer-joined query, so common subplans can be shared; slower than collect_all on the full
+        # feature set, where the wide join costs more than the sharing saves
+        fused, *other_plans = plans.values()
+        for plan in other_plans:
+            fused = fused.join(plan, how="outer", on="user_id")
+        start = perf_counter()
+        fused = fused.sort("user_id").collect()
+        self.timings_[FUSED] = perf_counter() - start
+        return fused
+
+
+def as_lazy(data: str | pl.DataFrame | pl.LazyFrame) -> pl.LazyFrame:
+    if isinstance(data, str):
+        return scan_dataset(data)
+    return data.lazy()
+
+
+def marker(name: str) -> str:
+    return f"__{name}"
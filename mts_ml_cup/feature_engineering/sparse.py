@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import itertools as it
+import json
+import math
+import os
+from typing import Iterator, Optional
+
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import scipy.sparse as sp
+
+from mts_ml_cup.feature_engineering.buckets import bucket_sources, load_bucket
+from mts_ml_cup.feature_engineering.url import hash_ngrams
+from mts_ml_cup.utils import load_arrays, save_arrays, scan_dataset
+
+WEIGHTS = {
+    "requests": pl.col("request_cnt").sum(),
+    "days": pl.col("date").n_unique(),
+    "binary": pl.count(),
+}
+
+
+def user_url_matrix(
+    sessions: pl.DataFrame | pl.LazyFrame,
+    weight: str = "requests",
+    n_columns: Optional[int] = None,
+    dtype: np.dtype = np.float32,
+) -> tuple[np.ndarray, sp.csr_matrix]:
+    cells = (
+        sessions
+        .lazy()
+        .groupby(["user_id", "url_id"])
+        .agg(WEIGHTS[weight].alias("value"))
+        .sort(["user_id", "url_id"])
+        .collect()
+    )
+    values = cells["value"].to_numpy()
+    if weight == "binary":
+        values = np.ones(len(values), dtype=dtype)
+    return to_csr(cells["user_id"].to_numpy(), cells["url_id"].to_numpy(), values, n_columns, dtype)
+
+
+def user_url_matrix_by_buckets(
+    sessions_path: str,
+    weight: str = "requests",
+    n_buckets: int = 16,
+    n_columns: Optional[int] = None,
+    dtype: np.dtype = np.float32,
+) -> tuple[np.ndarray, sp.csr_matrix]:
+    chunks = list(iter_user_url_matrices(sessions_path, weight, n_buckets, n_columns, dtype))
+    user_ids = np.concatenate([user_ids for user_ids, _ in chunks])
+    matrix = sp.vstack([matrix for _, matrix in chunks], format="csr")
+    del chunks
+    order = np.argsort(user_ids, kind="stable")
+    return user_ids[order], matrix[order]
+
+
+def iter_user_url_matrices(
+    sessions_path: str,
+    weight: str = "requests",
+    n_buckets: int = 16,
+    n_columns: Optional[int] = None,
+    dtype: np.dtype = np.float32,
+) -> Iterator[tuple[np.ndarray, sp.csr_matrix]]:
+    # every chunk must have the same width, so it is taken from the whole dataset up front
+    if n_columns is None:
+        n_columns = scan_dataset(os.path.expanduser(sessions_path)).select(pl.col("url_id").max()).collect().item() + 1
+    sources, _ = bucket_sources(sessions_path, n_buckets)
+    for path, bucket, n_buckets in sources:
+        sessions = load_bucket(path, bucket, n_buckets)
+        if sessions.height > 0:
+            yield user_url_matrix(sessions, weight, n_columns, dtype)
+
+
+def list_column_matrix(
+    frame: pl.DataFrame,
+    column: str,
+    n_columns: Optional[int] = None,
+    binary: bool = False,
+    dtype: np.dtype = np.float32,
+) -> tuple[np.ndarray, sp.csr_matrix]:
+    # ids wider than n_columns (e.g. hashed k-grams) are folded into it; repeated ids are counted
+    lists = frame[column].to_arrow()
+    if isinstance(lists, pa.ChunkedArray):
+        lists = pa.concat_arrays(lists.chunks)
+    ids = lists.flatten().to_numpy()
+    if n_columns is None:
+        n_columns = int(ids.max()) + 1 if len(ids) else 0
+    lengths = frame[column].arr.lengths().to_numpy().astype(np.int64)
+
+    index_dtype = index_dtype_for(max(len(ids), n_columns))
+    indptr = np.zeros(len(lengths) + 1, dtype=index_dtype)
+    np.cumsum(lengths, out=indptr[1:])
+    matrix = sp.csr_matrix(
+        (np.ones(len(ids), dtype=dtype), (ids % np.asarray(n_columns, dtype=ids.dtype)).astype(index_dtype), indptr),
+        shape=(len(lengths), n_columns),
+    )
+    matrix.sum_duplicates()
+    if binary:
+        matrix.data[:] = 1
+    return frame["user_id"].to_numpy(), matrix
+
+
+def hashed_url_combinations(
+    user_ids: np.ndarray,
+    url_ids: np.ndarray,
+    k: int = 2,
+    n_features: int = 2**20,
+    signed: bool = True,
+    batch_size: int = 256,
+    dtype: np.dtype = np.float32,
+) -> tuple[np.ndarray, sp.csr_matrix]:
+    chunks = list(iter_hashed_url_combinations(user_ids, url_ids, k, n_features, signed, batch_size, dtype))
+    if not chunks:
+        return np.asarray(user_ids), sp.csr_matrix((0, n_features), dtype=dtype)
+    return (
+        np.concatenate([user_ids for user_ids, _ in chunks]),
+        sp.vstack([matrix for _, matrix in chunks], format="csr"),
+    )
+
+
+def iter_hashed_url_combinations(
+    user_ids: np.ndarray,
+    url_ids: np.ndarray,
+    k: int = 2,
+    n_features: int = 2**20,
+    signed: bool = True,
+    batch_size: int = 256,
+    dtype: np.dtype = np.float32,
+) -> Iterator[tuple[np.ndarray, sp.csr_matrix]]:
+    # url_ids is the top-n matrix from top_n_url_ids_by_user (0 is trailing padding), memory grows with
+    # batch_size * C(top_n, k) and never with the number of distinct combinations
+    positions = colex_combinations(url_ids.shape[1], k)
+    for start in range(0, len(url_ids), batch_size):
+        batch = np.asarray(url_ids[start:start + batch_size])
+        lengths = np.count_nonzero(batch, axis=1)
+        rows, hashes = [], []
+        # rows of the same length share their combinations, the ones touching padding are never built
+        for length in np.unique(lengths[lengths >= k]):
+            group = np.flatnonzero(lengths == length)
+            n_combinations = math.comb(int(length), k)
+            # a combination is a set of urls, so its ids are sorted before hashing
+            combinations = np.sort(batch[group][:, positions[:, :n_combinations]], axis=1)
+            hashes.append(hash_ngrams([combinations[:, i].ravel().astype(np.uint64) for i in range(k)]))
+            rows.append(np.repeat(group, n_combinations))
+        hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+
+        index_dtype = index_dtype_for(max(len(hashes), n_features))
+        if signed:
+            # the index takes the low bits, the sign the highest one
+            values = (1 - 2 * (hashes >> np.uint64(63)).astype(np.int8)).astype(dtype)
+        else:
+            values = np.ones(len(hashes), dtype=dtype)
+        # duplicates are summed while converting to csr
+        matrix = sp.csr_matrix(
+            (values, (rows.astype(index_dtype), (hashes % np.uint64(n_features)).astype(index_dtype))),
+            shape=(len(batch), n_features),
+        )
+        matrix.eliminate_zeros()
+        yield np.asarray(user_ids[start:start + batch_size]), matrix
+
+
+def colex_combinations(n: int, k: int) -> np.ndarray:
+    # in colexicographic order the combinations of range(length) are the first C(length, k) columns
+    combinations = sorted(it.combinations(range(n), k), key=lambda combination: combination[::-1])
+    return np.array(combinations, dtype=np.intp).reshape(-1, k).T
+
+
+def to_csr(
+    users: np.ndarray,
+    columns: np.ndarray,
+    values: np.ndarray,
+    n_columns: Optional[int] = None,
+    dtype: np.dtype = np.float32,
+) -> tuple[np.ndarray, sp.csr_matrix]:
+    # cells must be sorted by user, so row boundaries are where the user changes
+    if n_columns is None:
+        n_columns = int(columns.max()) + 1 if len(columns) else 0
+    index_dtype = index_dtype_for(max(len(columns), n_columns))
+    starts = np.flatnonzero(users[1:] != users[:-1]) + 1
+    indptr = np.concatenate([[0], starts, [len(users)]]).astype(index_dtype) if len(users) else np.zeros(1, index_dtype)
+    user_ids = users[indptr[:-1]]
+    matrix = sp.csr_matrix(
+        (values.astype(dtype, copy=False), columns.astype(index_dtype), indptr),
+        shape=(len(user_ids), n_columns),
+    )
+    return user_ids, matrix
+
+
+def index_dtype_for(max_value: int) -> np.dtype:
+    return np.int32 if max_value <= np.iinfo(np.int32).max else np.int64
+
+
+def save_csr(path: str, user_ids: np.ndarray, matrix: sp.csr_matrix, memmap: bool = True) -> None:
+    os.makedirs(path, exist_ok=True)
+    if not memmap:
+        sp.save_npz(os.path.join(path, "matrix.npz"), matrix)
+        np.save(os.path.join(path, "user_ids.npy"), user_ids)
+        return
+
+    save_arrays(
+        path, {"user_ids": user_ids, "data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr}
+    )
+    with open(os.path.join(path, "matrix.json"), "w") as f:
+        json.dump({"shape": list(matrix.shape)}, f, indent=2)
+
+
+def load_csr(path: str, mmap_mode: Optional[str] = "r") -> tuple[np.ndarray, sp.csr_matrix]:
+    user_ids = np.load(os.path.join(path, "user_ids.npy"), mmap_mode=mmap_mode)
+    if os.path.exists(os.path.join(path, "matrix.npz")):
+        return user_ids, sp.load_npz(os.path.join(path, "matrix.npz")).tocsr()
+
+    with open(os.path.join(path, "matrix.json")) as f:
+        meta = json.load(f)
+    matrix = sp.csr_matrix(
+        load_arrays(path, ["data", "indices", "indptr"], mmap_mode),
+        shape=tuple(meta["shape"]),
+        copy=False,
+    )
+    return user_ids, matrix
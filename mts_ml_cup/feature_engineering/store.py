@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+from types import ModuleType
+from typing import Any, Iterable, Optional
+
+import polars as pl
+
+from mts_ml_cup.feature_engineering.plan import FEATURES, Feature, FeaturePlan
+from mts_ml_cup.utils import dataset_fingerprint
+
+
+class FeatureStore:
+    def __init__(self, path: str, registry: Optional[dict[str, Feature]] = None) -> None:
+        self.path = os.path.expanduser(path)
+        self.registry = registry if registry is not None else FEATURES
+
+    def features_file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.pq")
+
+    def metadata_file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.json")
+
+    def metadata(self, name: str) -> Optional[dict[str, Any]]:
+        if not os.path.exists(self.metadata_file(name)) or not os.path.exists(self.features_file(name)):
+            return None
+        with open(self.metadata_file(name)) as f:
+            return json.load(f)
+
+    def fingerprint(self, name: str, datasets_fingerprints: dict[str, str]) -> dict[str, Any]:
+        feature = self.registry[name]
+        return {
+            "inputs": {input_name: datasets_fingerprints[input_name] for input_name in feature.inputs},
+            "source": source_fingerprint(feature.func),
+            "params": json.loads(json.dumps(feature.params, sort_keys=True, default=repr)),
+        }
+
+    def stale(
+        self,
+        features: Optional[list[str]] = None,
+        datasets_fingerprints: Optional[dict[str, str]] = None,
+        **datasets: str | pl.DataFrame | pl.LazyFrame,
+    ) -> list[str]:
+        features = features if features is not None else list(self.registry)
+        if datasets_fingerprints is None:
+            datasets_fingerprints = {name: dataset_fingerprint(data) for name, data in datasets.items()}
+        stale_features = []
+        for name in features:
+            metadata = self.metadata(name)
+            if metadata is None or metadata["fingerprint"] != self.fingerprint(name, datasets_fingerprints):
+                stale_features.append(name)
+        return stale_features
+
+    def update(
+        self,
+        features: Optional[list[str]] = None,
+        fuse: bool = False,
+        timed: bool = False,
+        **datasets: str | pl.DataFrame | pl.LazyFrame,
+    ) -> dict[str, float]:
+        datasets_fingerprints = {name: dataset_fingerprint(data) for name, data in datasets.items()}
+        stale_features = self.stale(features, datasets_fingerprints)
+        if not stale_features:
+            return {}
+
+        plan = FeaturePlan(stale_features, registry=self.registry)
+        for name, features_frame in plan.collect(fuse, timed, **datasets).items():
+            self.save(name, features_frame, self.fingerprint(name, datasets_fingerprints))
+        return plan.timings_
+
+    def save(self, name: str, features: pl.DataFrame, fingerprint: dict[str, Any]) -> None:
+        features_file, metadata_file = self.features_file(name), self.metadata_file(name)
+        os.makedirs(os.path.dirname(features_file), exist_ok=True)
+        features.write_parquet(f"{features_file}.tmp")
+        os.replace(f"{features_file}.tmp", features_file)
+        with open(f"{metadata_file}.tmp", "w") as f:
+            json.dump({"feature": name, "fingerprint": fingerprint, "columns": features.columns}, f, indent=2)
+        os.replace(f"{metadata_file}.tmp", metadata_file)
+
+    def load(
+        self,
+        features: Optional[list[str]] = None,
+        users: Optional[Iterable[int]] = None,
+        columns: Optional[list[str]] = None,
+    ) -> pl.DataFrame:
+        features = features if features is not None else self.available()
+        users_filter = None
+        if users is not None:
+            users = pl.Series("user_id", users if isinstance(users, pl.Series) else list(users)).cast(pl.UInt32)
+            users_filter = pl.col("user_id").is_in(users)
+
+        plans = []
+        for name in features:
+            metadata = self.metadata(name)
+            if metadata is None:
+                raise KeyError(f"feature {name!r} is not in the store, run update first")
+            feature_columns = [
+                col for col in metadata["columns"]
+                if col != "user_id" and (columns is None or col in columns)
+            ]
+            if columns is not None and not feature_columns:
+                continue
+            plan = pl.scan_parquet(self.features_file(name)).select(["user_id"] + feature_columns)
+            if users_filter is not None:
+                plan = plan.filter(users_filter)
+            plans.append(plan)
+
+        if not plans:
+            if columns is not None:
+                raise KeyError(f"none of the columns {columns} is in the stored features {features}")
+            raise KeyError("the store has no features, run update first")
+
+        if users is not None:
+            loaded = users.to_frame().lazy()
+            for plan in plans:
+                loaded = loaded.join(plan, how="left", on="user_id")
+            return loaded.collect()
+
+        loaded, *other_plans = plans
+        for plan in other_plans:
+            loaded = loaded.join(plan, how="outer", on="user_id")
+        return loaded.sort("user_id").collect()
+
+    def available(self) -> list[str]:
+        return [name for name in self.registry if self.metadata(name) is not None]
+
+
+def source_fingerprint(func: Any) -> str:
+    # features often only delegate, so the project modules they reach are hashed with them
+    source_hash = hashlib.sha256(inspect.getsource(func).encode("utf-8"))
+    for name, module in sorted(project_modules(func).items()):
+        source_hash.update(name.encode("utf-8"))
+        source_hash.update(inspect.getsource(module).encode("utf-8"))
+    return source_hash.hexdigest()[:16]
+
+
+def project_modules(func: Any, package: str = "mts_ml_cup") -> dict[str, ModuleType]:
+    modules = {}
+    to_visit = [inspect.getmodule(func)]
+    while to_visit:
+        module = to_visit.pop()
+        if module is None or module.__name__.split(".")[0] != package or module.__name__ in modules:
+            continue
+        modules[module.__name__] = module
+        for value in vars(module).values():
+            to_visit.append(value if isinstance(value, ModuleType) else inspect.getmodule(value))
+    return modules
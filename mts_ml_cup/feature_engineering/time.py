@@ -1,18 +1,34 @@
+from __future__ import annotations
+
 import polars as pl
+from mts_ml_cup.utils import weighted_mode_by_user
 
+PARTS_OF_DAY = (1, 2, 3, 4)
 
-def time_period_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
-    return (
+
+def time_period_by_user(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return time_period_from_first_last_day(
         sessions
         .groupby("user_id")
         .agg(
             [
                 pl.col("date").min().alias("first_day"),
                 pl.col("date").max().alias("last_day"),
-                pl.col("date").dt.truncate("1mo").min().alias("first_month"),
-                pl.col("date").dt.truncate("1mo").max().alias("last_month"),
-                pl.col("date").dt.truncate("1y").min().alias("first_year"),
-                pl.col("date").dt.truncate("1y").max().alias("last_year"),
+            ]
+        )
+    )
+
+
+def time_period_from_first_last_day(first_last_day: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    # truncation is monotonic, so truncating the first and last day is the same as min/max of truncated dates
+    return (
+        first_last_day
+        .with_columns(
+            [
+                pl.col("first_day").dt.truncate("1mo").alias("first_month"),
+                pl.col("last_day").dt.truncate("1mo").alias("last_month"),
+                pl.col("first_day").dt.truncate("1y").alias("first_year"),
+                pl.col("last_day").dt.truncate("1y").alias("last_year"),
             ]
         )
         .select(
@@ -32,25 +48,28 @@ def time_period_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def top_part_of_day_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
-    return (
-        sessions
-        .groupby(["user_id", "part_of_day_id"])
-        .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "part_of_day_id"])
-        .groupby("user_id")
-        .agg(pl.col("part_of_day_id").last())
-        .select(["user_id", pl.col("part_of_day_id").alias("time_top_part_of_day")])
-    )
+def top_part_of_day_by_user(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return weighted_mode_by_user(sessions, ["part_of_day_id"]).select(["user_id"] + top_part_of_day_exprs())
 
 
-def part_of_day_distribution_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
-    return (
+def top_part_of_day_exprs() -> list[pl.Expr]:
+    return [pl.col("part_of_day_id").alias("time_top_part_of_day")]
+
+
+def part_of_day_distribution_by_user(
+    sessions: pl.DataFrame | pl.LazyFrame,
+    parts_of_day: tuple[int, ...] = PARTS_OF_DAY,
+) -> pl.DataFrame:
+    # pivot is eager-only, so lazy input is collected right before it; the columns come from
+    # parts_of_day and not from the data, so every subset of users gets the same schema
+    shares = (
         sessions
+        .lazy()
         .groupby(["user_id", "part_of_day_id"])
         .agg(pl.col("request_cnt").sum())
         .join(
             sessions
+            .lazy()
             .groupby("user_id")
             .agg(pl.col("request_cnt").sum().alias("total_request_cnt")),
             on="user_id",
@@ -62,16 +81,20 @@ def part_of_day_distribution_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
                 (pl.col("request_cnt") / pl.col("total_request_cnt")).alias("requests_share")
             ]
         )
-        .pivot(
-            values="requests_share",
-            index="user_id",
-            columns="part_of_day_id",
-        )
-        .rename(
-            {
-                str(part_of_day_id): f"time_part_of_day_{part_of_day_id}_requests_share"
-                for part_of_day_id in sessions["part_of_day_id"].unique()
-            }
+        .collect()
+    )
+    distribution = shares.pivot(values="requests_share", index="user_id", columns="part_of_day_id")
+    return (
+        distribution
+        .select(
+            [
+                "user_id",
+                *[
+                    (pl.col(str(part_of_day_id)) if str(part_of_day_id) in distribution.columns else pl.lit(0.0))
+                    .alias(f"time_part_of_day_{part_of_day_id}_requests_share")
+                    for part_of_day_id in parts_of_day
+                ],
+            ]
         )
         .fill_null(0)
     )
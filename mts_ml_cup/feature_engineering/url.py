@@ -1,23 +1,52 @@
+from __future__ import annotations
+
 import itertools as it
 
+import numpy as np
 import polars as pl
-import nltk
+import pyarrow as pa
+from mts_ml_cup.utils import lazy_like, load_arrays, save_arrays
 
 
-def urls_stats_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
+def host_attributes(urls: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
-        sessions
-        .select(["user_id", "url_host"])
-        .unique()
-        .with_columns(
+        urls
+        .select(
             [
-                pl.col("url_host").str.lengths().alias("chars_in_url"),
-                pl.col("url_host").apply(lambda url: len(url.split("."))).alias("domains_in_url"),
+                "url_id",
+                "url_host",
+                pl.col("url_host").str.count_match(r"\.").alias("dots"),
                 pl.col("url_host").str.ends_with("turbopages.org").alias("is_yandex_turbo"),
                 pl.col("url_host").str.ends_with("cdn.ampproject.org").alias("is_google_turbo"),
-                pl.col("url_host").apply(lambda url: any(filter(lambda domain: domain == "m", url.split(".")))).alias("is_mobile"),
             ]
         )
+        .select(
+            [
+                "url_id",
+                pl.col("url_host").str.lengths().alias("chars_in_url"),
+                (pl.col("dots") + 1).alias("domains_in_url"),
+                pl.col("dots").alias("url_depth"),
+                pl.col("url_host").str.extract(r"([^.]*)$").alias("url_tld"),
+                "is_yandex_turbo",
+                "is_google_turbo",
+                (pl.col("is_yandex_turbo") | pl.col("is_google_turbo")).alias("is_turbo"),
+                pl.col("url_host").str.contains(r"(^|\.)amp(\.|$)|ampproject\.org$").alias("is_amp"),
+                pl.col("url_host").str.contains(r"(^|\.)m(\.|$)").alias("is_mobile"),
+            ]
+        )
+    )
+
+
+def urls_stats_by_user(
+    sessions: pl.DataFrame | pl.LazyFrame,
+    urls: pl.DataFrame | pl.LazyFrame,
+) -> pl.DataFrame | pl.LazyFrame:
+    # host attributes are computed once per host, not once per (user, host) pair
+    return (
+        sessions
+        .select(["user_id", "url_id"])
+        .unique()
+        .join(host_attributes(lazy_like(urls, sessions)), how="left", on="url_id")
         .groupby("user_id")
         .agg(
             [
@@ -32,54 +61,148 @@ def urls_stats_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def top_n_urls_by_user(sessions: pl.DataFrame, top_n: int = 120) -> pl.DataFrame:
-    return (
+def top_n_url_ids_by_user(sessions: pl.DataFrame | pl.LazyFrame, top_n: int = 120) -> tuple[np.ndarray, np.ndarray]:
+    # ties go to the smaller url_id, rows are padded with 0 which is never a url_id
+    top_urls = (
         sessions
-        .groupby(["user_id", "url_host"])
+        .lazy()
+        .groupby(["user_id", "url_id"])
         .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "url_host"], descending=[False, True, False])
         .groupby("user_id")
-        .head(top_n)
-        .select(["user_id", "url_host"])
-        .with_columns(pl.lit(1).alias("ones"))
-        .select(
-            [
-                pl.all().exclude("ones"),
-                pl.col("ones").cumsum().over("user_id").alias("top_url")
-            ]
-        )
-        .select(pl.exclude("ones"))
-        .pivot(
-            index="user_id",
-            columns="top_url",
-            values="url_host",
-        )
-        .with_columns(pl.col(str(col)).fill_null("") for col in range(1, top_n + 1))
-        .rename({str(col): f"url_top_{col}_url" for col in range(1, top_n + 1)})
+        .agg(pl.col("url_id").sort_by(["request_cnt", "url_id"], descending=[True, False]).head(top_n))
+        .sort("user_id")
+        .collect()
     )
+    lengths = top_urls["url_id"].arr.lengths().to_numpy().astype(np.int64)
+    starts = np.cumsum(lengths) - lengths
+    url_ids = np.zeros((top_urls.height, top_n), dtype=np.uint32)
+    url_ids[
+        np.repeat(np.arange(top_urls.height), lengths),
+        np.arange(lengths.sum()) - np.repeat(starts, lengths),
+    ] = top_urls["url_id"].explode().to_numpy()
+    return top_urls["user_id"].to_numpy(), url_ids
+
+
+def save_top_n_url_ids(path: str, user_ids: np.ndarray, url_ids: np.ndarray) -> None:
+    save_arrays(path, {"user_ids": user_ids, "top_url_ids": url_ids})
 
 
-def all_urls_by_user_as_text(sessions: pl.DataFrame) -> pl.DataFrame:
+def load_top_n_url_ids(path: str, mmap_mode: str = "r") -> tuple[np.ndarray, np.ndarray]:
+    return load_arrays(path, ["user_ids", "top_url_ids"], mmap_mode)
+
+
+def top_n_urls_as_strings(
+    user_ids: np.ndarray,
+    url_ids: np.ndarray,
+    urls: pl.DataFrame | pl.LazyFrame,
+) -> pl.DataFrame:
+    urls = urls.lazy().select(["url_id", "url_host"]).collect()
+    hosts = (
+        pl.Series("url_id", np.arange(max(urls["url_id"].max(), url_ids.max()) + 1), dtype=pl.UInt32)
+        .to_frame()
+        .join(urls, how="left", on="url_id")
+        .get_column("url_host")
+        .fill_null("")
+    )
+    return pl.DataFrame(
+        [pl.Series("user_id", user_ids)]
+        + [hosts.take(url_ids[:, col]).alias(f"url_top_{col + 1}_url") for col in range(url_ids.shape[1])]
+    )
+
+
+def top_n_urls_by_user(
+    sessions: pl.DataFrame | pl.LazyFrame,
+    urls: pl.DataFrame | pl.LazyFrame,
+    top_n: int = 120,
+) -> pl.DataFrame:
+    return top_n_urls_as_strings(*top_n_url_ids_by_user(sessions, top_n), urls)
+
+
+def all_urls_by_user_as_text(
+    sessions: pl.DataFrame | pl.LazyFrame,
+    urls: pl.DataFrame | pl.LazyFrame,
+) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
-        .groupby(["user_id", "url_host"])
+        .groupby(["user_id", "url_id"])
         .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "url_host"], descending=[False, True, False])
+        .join(lazy_like(urls, sessions).select(["url_id", "url_host"]), how="left", on="url_id")
+        .sort(["user_id", "request_cnt", "url_id"], descending=[False, True, False])
         .groupby("user_id")
         .agg(pl.col("url_host").apply(lambda urls: " ".join(urls)).alias("url_all_visited_urls"))
     )
 
 
-def all_urls_ngrams_as_text(sessions: pl.DataFrame, k: int = 2) -> pl.DataFrame:
+def all_urls_ngrams_as_text(
+    sessions: pl.DataFrame | pl.LazyFrame,
+    urls: pl.DataFrame | pl.LazyFrame,
+    k: int = 2,
+) -> pl.DataFrame | pl.LazyFrame:
+    # the j-th url of a k-gram is the url shifted by j rows; it is valid while the user does not change
+    ordered_urls = (
+        ordered_urls_by_user(sessions)
+        .join(lazy_like(urls, sessions).select(["url_id", "url_host"]), how="left", on="url_id")
+    )
+    ngrams = (
+        ordered_urls
+        .select(
+            [
+                "user_id",
+                pl.col("user_id").shift(-(k - 1)).alias("last_user_id"),
+                pl.concat_str([pl.col("url_host").shift(-j) for j in range(k)], sep="_+_").alias("ngram"),
+            ]
+        )
+        .filter(pl.col("user_id") == pl.col("last_user_id"))
+        .groupby("user_id")
+        .agg(pl.col("ngram").str.concat(" ").alias(f"url_all_visited_urls_{k}grams"))
+    )
+    return (
+        ordered_urls
+        .select("user_id")
+        .unique()
+        .join(ngrams, how="left", on="user_id")
+        .with_columns(pl.col(f"url_all_visited_urls_{k}grams").fill_null(""))
+    )
+
+
+def all_urls_ngrams_as_ids(sessions: pl.DataFrame | pl.LazyFrame, k: int = 2) -> pl.DataFrame:
+    ordered_urls = ordered_urls_by_user(sessions.lazy()).collect()
+    users = ordered_urls["user_id"].to_numpy()
+    user_ids, lengths = np.unique(users, return_counts=True)
+    url_ids = ordered_urls["url_id"].to_numpy().astype(np.uint64)
+    n_starts = max(len(url_ids) - k + 1, 0)
+    is_start = users[:n_starts] == users[k - 1:k - 1 + n_starts]
+    ngram_ids = hash_ngrams([url_ids[j:j + n_starts] for j in range(k)])[is_start]
+
+    offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.maximum(lengths - k + 1, 0))
+    return pl.DataFrame(
+        [
+            pl.Series("user_id", user_ids),
+            pl.from_arrow(pa.LargeListArray.from_arrays(offsets, ngram_ids)).alias(f"url_all_visited_urls_{k}grams_ids"),
+        ]
+    )
+
+
+def ordered_urls_by_user(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
-        .groupby(["user_id", "url_host"])
+        .groupby(["user_id", "url_id"])
         .agg(pl.col("request_cnt").sum())
-        .sort(["user_id", "request_cnt", "url_host"], descending=[False, True, False])
-        .groupby("user_id")
-        .agg(
-            pl.col("url_host")
-            .apply(lambda urls: " ".join(map(lambda url_pair: "_+_".join(url_pair), nltk.bigrams(urls))))
-            .alias(f"url_all_visited_urls_{k}grams")
-        )
+        .sort(["user_id", "request_cnt", "url_id"], descending=[False, True, False])
+        .select(["user_id", "url_id"])
     )
+
+
+def hash_ngrams(columns: list[np.ndarray]) -> np.ndarray:
+    # FNV-1a over the url ids, then the murmur3 finalizer to spread the bits
+    ngram_ids = np.full(len(columns[0]), 0xCBF29CE484222325, dtype=np.uint64)
+    for column in columns:
+        ngram_ids ^= column
+        ngram_ids *= np.uint64(0x100000001B3)
+    ngram_ids ^= ngram_ids >> np.uint64(33)
+    ngram_ids *= np.uint64(0xFF51AFD7ED558CCD)
+    ngram_ids ^= ngram_ids >> np.uint64(33)
+    ngram_ids *= np.uint64(0xC4CEB9FE1A85EC53)
+    ngram_ids ^= ngram_ids >> np.uint64(33)
+    return ngram_ids
@@ -1,7 +1,47 @@
+from __future__ import annotations
+
+import os
+
 import polars as pl
+from mts_ml_cup.utils import dataset_fingerprint, packed_key, scan_dataset
 
 
-def total_usage_stats_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
+def session_cube(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    # every usage feature only needs request_cnt summed per (user, date, part of day, url)
+    return (
+        sessions
+        .groupby(["user_id", "date", "part_of_day_id", "url_id"])
+        .agg(pl.col("request_cnt").sum())
+    )
+
+
+def cached_session_cube(sessions_path: str, cache_path: str) -> pl.DataFrame:
+    cache_path = os.path.expanduser(cache_path)
+    cache_file = os.path.join(cache_path, f"session-cube-{dataset_fingerprint(sessions_path)}.parquet")
+    if os.path.exists(cache_file):
+        return pl.read_parquet(cache_file)
+
+    cube = (
+        session_cube(scan_dataset(sessions_path))
+        .sort(["user_id", "date", "part_of_day_id", "url_id"])
+        .collect()
+    )
+    os.makedirs(cache_path, exist_ok=True)
+    cube.write_parquet(f"{cache_file}.tmp")
+    os.replace(f"{cache_file}.tmp", cache_file)
+    return cube
+
+
+def all_usage_stats_by_user(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    # sessions or an already built cube: the cube is computed once and shared by all plans
+    cube = session_cube(sessions.lazy())
+    usage_stats, *other_stats = [usage_stats_by_user(cube) for usage_stats_by_user in USAGE_STATS]
+    for stats in other_stats:
+        usage_stats = usage_stats.join(stats, how="left", on="user_id")
+    return usage_stats.collect() if isinstance(sessions, pl.DataFrame) else usage_stats
+
+
+def total_usage_stats_by_user(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
         .groupby("user_id")
@@ -10,17 +50,17 @@ def total_usage_stats_by_user(sessions: pl.DataFrame) -> pl.DataFrame:
                 pl.col("request_cnt").sum().alias("usage_total_requests"),
                 pl.col("date").n_unique().alias("usage_total_dates"),
                 pl.col("part_of_day_id").n_unique().alias("usage_total_parts_of_day"),
-                pl.col("url_host").n_unique().alias("usage_total_urls"),
-                pl.struct(["date", "part_of_day_id"]).n_unique().alias("usage_total_sessions"),
-                pl.struct(["date", "url_host"]).n_unique().alias("usage_total_daily_visits"),
-                pl.struct(["part_of_day_id", "url_host"]).n_unique().alias("usage_total_partly_visits"),
-                pl.struct(["date", "part_of_day_id", "url_host"]).n_unique().alias("usage_total_visits"),
+                pl.col("url_id").n_unique().alias("usage_total_urls"),
+                packed_key(["date", "part_of_day_id"]).n_unique().alias("usage_total_sessions"),
+                packed_key(["date", "url_id"]).n_unique().alias("usage_total_daily_visits"),
+                packed_key(["part_of_day_id", "url_id"]).n_unique().alias("usage_total_partly_visits"),
+                packed_key(["date", "part_of_day_id", "url_id"]).n_unique().alias("usage_total_visits"),
             ]
         )
     )
 
 
-def usage_stats_per_date(sessions: pl.DataFrame) -> pl.DataFrame:
+def usage_stats_per_date(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
         .groupby(["user_id", "date"])
@@ -28,8 +68,8 @@ def usage_stats_per_date(sessions: pl.DataFrame) -> pl.DataFrame:
             [
                 pl.col("request_cnt").sum().alias("total_requests"),
                 pl.col("part_of_day_id").n_unique().alias("total_parts_of_day"),
-                pl.col("url_host").n_unique().alias("total_urls"),
-                pl.struct(["part_of_day_id", "url_host"]).n_unique().alias("total_partly_visits"),
+                pl.col("url_id").n_unique().alias("total_urls"),
+                packed_key(["part_of_day_id", "url_id"]).n_unique().alias("total_partly_visits"),
             ]
         )
         .groupby("user_id")
@@ -44,7 +84,7 @@ def usage_stats_per_date(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def usage_stats_per_part_of_day(sessions: pl.DataFrame) -> pl.DataFrame:
+def usage_stats_per_part_of_day(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
         .groupby(["user_id", "part_of_day_id"])
@@ -52,8 +92,8 @@ def usage_stats_per_part_of_day(sessions: pl.DataFrame) -> pl.DataFrame:
             [
                 pl.col("request_cnt").sum().alias("total_requests"),
                 pl.col("date").n_unique().alias("total_dates"),
-                pl.col("url_host").n_unique().alias("total_urls"),
-                pl.struct(["date", "url_host"]).n_unique().alias("total_daily_visits"),
+                pl.col("url_id").n_unique().alias("total_urls"),
+                packed_key(["date", "url_id"]).n_unique().alias("total_daily_visits"),
             ]
         )
         .groupby("user_id")
@@ -68,16 +108,16 @@ def usage_stats_per_part_of_day(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def usage_stats_per_url(sessions: pl.DataFrame) -> pl.DataFrame:
+def usage_stats_per_url(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
-        .groupby(["user_id", "url_host"])
+        .groupby(["user_id", "url_id"])
         .agg(
             [
                 pl.col("request_cnt").sum().alias("total_requests"),
                 pl.col("date").n_unique().alias("total_dates"),
                 pl.col("part_of_day_id").n_unique().alias("total_parts_of_day"),
-                pl.struct(["date", "part_of_day_id"]).n_unique().alias("total_sessions"),
+                packed_key(["date", "part_of_day_id"]).n_unique().alias("total_sessions"),
             ]
         )
         .groupby("user_id")
@@ -92,14 +132,14 @@ def usage_stats_per_url(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def usage_stats_per_session(sessions: pl.DataFrame) -> pl.DataFrame:
+def usage_stats_per_session(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
         .groupby(["user_id", "date", "part_of_day_id"])
         .agg(
             [
                 pl.col("request_cnt").sum().alias("total_requests"),
-                pl.col("url_host").n_unique().alias("total_urls"),
+                pl.col("url_id").n_unique().alias("total_urls"),
                 
             ]
         )
@@ -113,10 +153,10 @@ def usage_stats_per_session(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def usage_stats_per_daily_visit(sessions: pl.DataFrame) -> pl.DataFrame:
+def usage_stats_per_daily_visit(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
-        .groupby(["user_id", "date", "url_host"])
+        .groupby(["user_id", "date", "url_id"])
         .agg(
             [
                 pl.col("request_cnt").sum().alias("total_requests"),
@@ -134,10 +174,10 @@ def usage_stats_per_daily_visit(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def usage_stats_per_partly_visit(sessions: pl.DataFrame) -> pl.DataFrame:
+def usage_stats_per_partly_visit(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
-        .groupby(["user_id", "part_of_day_id", "url_host"])
+        .groupby(["user_id", "part_of_day_id", "url_id"])
         .agg(
             [
                 pl.col("request_cnt").sum().alias("total_requests"),
@@ -154,11 +194,23 @@ def usage_stats_per_partly_visit(sessions: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def usage_stats_per_visit(sessions: pl.DataFrame) -> pl.DataFrame:
+def usage_stats_per_visit(sessions: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
     return (
         sessions
-        .groupby(["user_id", "date", "part_of_day_id", "url_host"])
+        .groupby(["user_id", "date", "part_of_day_id", "url_id"])
         .agg(pl.col("request_cnt").sum().alias("total_requests"))
         .groupby("user_id")
         .agg(pl.col("total_requests").mean().alias("avg_requests_per_visit"))
     )
+
+
+USAGE_STATS = [
+    total_usage_stats_by_user,
+    usage_stats_per_date,
+    usage_stats_per_part_of_day,
+    usage_stats_per_url,
+    usage_stats_per_session,
+    usage_stats_per_daily_visit,
+    usage_stats_per_partly_visit,
+    usage_stats_per_visit,
+]
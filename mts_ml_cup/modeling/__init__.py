@@ -1,2 +1,3 @@
 from . import catboost
+from . import encoding
 from . import validation
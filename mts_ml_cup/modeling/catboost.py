@@ -1,7 +1,14 @@
 from __future__ import annotations
 
+import io
 import json
-from typing import Any, Callable, Optional
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterator, Optional
 from pathlib import Path
 
 import catboost as cb
@@ -10,7 +17,12 @@ import pandas as pd
 import polars as pl
 from catboost.utils import get_gpu_device_count
 
+from mts_ml_cup.modeling.encoding import FeaturesEncoder
 from mts_ml_cup.modeling.validation import kfold_split, calc_metrics
+from mts_ml_cup.utils import dataset_fingerprint
+
+TASKS = {"sex": "Logloss", "age": "MultiClass"}
+QUANTIZATION_PARAMS = ["border_count", "feature_border_type", "per_float_feature_quantization", "nan_mode"]
 
 
 class CatBoostCV:
@@ -27,43 +39,166 @@ class CatBoostCV:
         self.pool_params = pool_params
         self.splitter = splitter
 
-    def fit(self, train: pl.DataFrame, verbose: int = 1_000) -> list[dict[str, float]]:
+    def fit(
+        self,
+        train: pl.DataFrame,
+        verbose: int = 1_000,
+        n_parallel: int = 1,
+        pools_path: Optional[str | Path] = None,
+    ) -> list[dict[str, float]]:
         self.models_sex_ = []
         self.models_age_ = []
         self.metrics_ = []
 
-        for fold, (train_idx, val_idx) in enumerate(self.splitter(train)):
-            train_fold, val_fold = train[train_idx], train[val_idx]
-
-            train_fold_sex_pool = self.to_pool_sex(train_fold)
-            val_fold_sex_pool = self.to_pool_sex(val_fold)
-            fold_model_sex = cb.CatBoostClassifier(eval_metric="Logloss", loss_function="Logloss", **self.model_params)
-            fold_model_sex.fit(train_fold_sex_pool, eval_set=val_fold_sex_pool, verbose=verbose)
-            self.models_sex_.append(fold_model_sex)
-            
-            fold_train_age = self.to_pool_age(train_fold)
-            fold_val_age = self.to_pool_age(val_fold)
-            fold_model_age = cb.CatBoostClassifier(eval_metric="MultiClass", loss_function="MultiClass", **self.model_params)
-            fold_model_age.fit(fold_train_age, eval_set=fold_val_age, verbose=verbose)
-            self.models_age_.append(fold_model_age)
-
-            fold_metrics = calc_metrics(
-                is_male=val_fold_sex_pool.get_label(),
-                is_male_preds=fold_model_sex.predict_proba(val_fold_sex_pool)[:, 1],
-                age_bucket=fold_val_age.get_label(),
-                age_bucket_preds=fold_model_age.predict(fold_val_age),
+        folds = list(self.splitter(train))
+        labels = self.task_labels(train)
+        positions = [
+            {task: fold_positions(rows, train_idx, val_idx) for task, (rows, _) in labels.items()}
+            for train_idx, val_idx in folds
+        ]
+        if pools_path is not None and not self.quantizable():
+            warnings.warn(
+                "pools with text or embedding features are not quantized and cannot be saved, pools_path is ignored"
             )
-            print()
-            print(f"{'-' * 20} {fold = } {'-' * 20}")
-            for name, value in fold_metrics.items():
-                print(f"{name} = {value:.4f}")
-            print(f"{'-' * 20} {fold = } {'-' * 20}")
-            print()
-            self.metrics_.append(fold_metrics)
+            pools_path = None
+        with tempfile.TemporaryDirectory() as tmp_path:
+            if n_parallel > 1:
+                # pools cannot be pickled, so parallel jobs load them from disk
+                if pools_path is None and self.quantizable():
+                    pools_path = tmp_path
+                train_path = None
+                if pools_path is not None:
+                    self.build_pools(train, pools_path)
+                else:
+                    # and without quantized pools they read the frame once instead of getting pickled fold frames
+                    self.encoder_ = self.features_encoder().fit(train)
+                    train_path = os.path.join(tmp_path, "train.parquet")
+                    train.write_parquet(train_path)
+                results = self.fit_parallel(folds, positions, verbose, n_parallel, pools_path, train_path)
+            else:
+                pools = self.build_pools(train, pools_path)
+                results = (
+                    [
+                        self.fit_task(task, pools[task].slice(train_pos), pools[task].slice(val_pos), verbose)
+                        for task, (train_pos, val_pos) in fold_rows.items()
+                    ]
+                    for fold_rows in positions
+                )
+
+            for fold, (fold_sex, fold_age) in enumerate(results):
+                model_sex, is_male_preds, log_sex = fold_sex
+                model_age, age_bucket_preds, log_age = fold_age
+                print(log_sex + log_age, end="")
+                self.models_sex_.append(model_sex)
+                self.models_age_.append(model_age)
+
+                # labels are taken from the frame: pools loaded from disk keep them as strings
+                fold_metrics = calc_metrics(
+                    is_male=labels["sex"][1][positions[fold]["sex"][1]],
+                    is_male_preds=is_male_preds,
+                    age_bucket=labels["age"][1][positions[fold]["age"][1]],
+                    age_bucket_preds=age_bucket_preds.astype(labels["age"][1].dtype),
+                )
+                print()
+                print(f"{'-' * 20} {fold = } {'-' * 20}")
+                for name, value in fold_metrics.items():
+                    print(f"{name} = {value:.4f}")
+                print(f"{'-' * 20} {fold = } {'-' * 20}")
+                print()
+                self.metrics_.append(fold_metrics)
         
         return self.metrics_
 
+    def fit_parallel(
+        self,
+        folds: list[tuple[np.ndarray, np.ndarray]],
+        positions: list[dict[str, tuple[np.ndarray, np.ndarray]]],
+        verbose: int,
+        n_parallel: int,
+        pools_path: Optional[str | Path] = None,
+        train_path: Optional[str] = None,
+    ) -> Iterator[list[tuple[cb.CatBoostClassifier, np.ndarray, str]]]:
+        # every (fold, task) is a job, the thread budget is split evenly between the running jobs
+        thread_count = self.model_params.get("thread_count", -1)
+        thread_count = os.cpu_count() if thread_count == -1 else thread_count
+        job_cv = type(self)(
+            model_params={**self.model_params, "thread_count": max(1, thread_count // n_parallel)},
+            pool_params=self.pool_params,
+            splitter=self.splitter,
+        )
+        job_cv.encoder_ = self.encoder_
+
+        with ProcessPoolExecutor(n_parallel, mp_context=mp.get_context("spawn")) as pool:
+            futures = []
+            for (train_idx, val_idx), fold_rows in zip(folds, positions):
+                if pools_path is not None:
+                    jobs = [
+                        (job_cv.fit_task_from_file, task, str(pool_file(pools_path, task)), train_pos, val_pos)
+                        for task, (train_pos, val_pos) in fold_rows.items()
+                    ]
+                else:
+                    jobs = [(job_cv.fit_task_from_parquet, task, train_path, train_idx, val_idx) for task in TASKS]
+                futures.append([pool.submit(*job, verbose, capture_log=True) for job in jobs])
+            for fold_futures in futures:
+                yield [future.result() for future in fold_futures]
+
+    def fit_task(
+        self,
+        task: str,
+        train_pool: cb.Pool,
+        val_pool: cb.Pool,
+        verbose: int = 1_000,
+        capture_log: bool = False,
+    ) -> tuple[cb.CatBoostClassifier, np.ndarray, str]:
+        model = cb.CatBoostClassifier(eval_metric=TASKS[task], loss_function=TASKS[task], **self.model_params)
+        # logs of parallel jobs are kept and printed in fold order instead of interleaving
+        log = io.StringIO() if capture_log else sys.stdout
+        model.fit(train_pool, eval_set=val_pool, verbose=verbose, log_cout=log)
+
+        # the eval set approxes are kept by the model, so quantized pools loaded from disk are never predicted on
+        approx = np.asarray(model.get_test_eval())
+        preds = 1 / (1 + np.exp(-approx)) if task == "sex" else model.classes_[np.argmax(approx, axis=0)]
+        return model, preds, log.getvalue() if capture_log else ""
+
+    def fit_task_from_frames(
+        self,
+        task: str,
+        train_fold: pl.DataFrame,
+        val_fold: pl.DataFrame,
+        verbose: int = 1_000,
+        capture_log: bool = False,
+    ) -> tuple[cb.CatBoostClassifier, np.ndarray, str]:
+        to_pool = getattr(self, f"to_pool_{task}")
+        return self.fit_task(task, to_pool(train_fold), to_pool(val_fold), verbose, capture_log)
+
+    def fit_task_from_parquet(
+        self,
+        task: str,
+        path: str,
+        train_idx: np.ndarray,
+        val_idx: np.ndarray,
+        verbose: int = 1_000,
+        capture_log: bool = False,
+    ) -> tuple[cb.CatBoostClassifier, np.ndarray, str]:
+        train = pl.read_parquet(path)
+        return self.fit_task_from_frames(task, train[train_idx], train[val_idx], verbose, capture_log)
+
+    def fit_task_from_file(
+        self,
+        task: str,
+        path: str,
+        train_positions: np.ndarray,
+        val_positions: np.ndarray,
+        verbose: int = 1_000,
+        capture_log: bool = False,
+    ) -> tuple[cb.CatBoostClassifier, np.ndarray, str]:
+        pool = cb.Pool(f"quantized://{path}")
+        return self.fit_task(task, pool.slice(train_positions), pool.slice(val_positions), verbose, capture_log)
+
     def predict(self, test: pl.DataFrame, fold: Optional[int] = None) -> pd.DataFrame:
+        return self.predict_pool(self.to_pool(test), test["user_id"], fold)
+
+    def predict_pool(self, test_pool: cb.Pool, user_ids: pl.Series, fold: Optional[int] = None) -> pd.DataFrame:
         if fold is not None:
             models_sex = [self.models_sex_[fold]]
             models_age = [self.models_age_[fold]]
@@ -71,12 +206,11 @@ class CatBoostCV:
             models_sex = self.models_sex_
             models_age = self.models_age_
 
-        test_pool = self.to_pool(test)
         is_male = np.mean([model.predict_proba(test_pool)[:, 1] for model in models_sex], axis=0)
         age_probas = np.mean([model.predict_proba(test_pool) for model in models_age], axis=0)
     
         pred = pd.DataFrame()
-        pred.loc[:, "user_id"] = test["user_id"].to_pandas()
+        pred.loc[:, "user_id"] = user_ids.to_pandas()
         pred.loc[:, "is_male"] = is_male
         pred.loc[:, [f"age_bucket_{i}_proba" for i in range(1, age_probas.shape[1] + 1)]] = age_probas
         pred.loc[:, "age"] = np.argmax(age_probas, axis=1) + 1
@@ -84,9 +218,11 @@ class CatBoostCV:
         return pred
 
     def predict_oof(self, train: pl.DataFrame) -> pd.DataFrame:
+        # one pool for the whole train, every fold takes its validation rows from it
+        train_pool = self.to_pool(train)
         return pd.concat(
             [
-                self.predict(train[val_idx], fold=fold).assign(fold=fold)
+                self.predict_pool(train_pool.slice(val_idx), train["user_id"][val_idx], fold=fold).assign(fold=fold)
                 for fold, (_, val_idx) in enumerate(self.splitter(train))
             ]
         ).reset_index(drop=True)
@@ -100,7 +236,7 @@ class CatBoostCV:
 
     def to_pool(self, dataset: pl.DataFrame) -> cb.Pool:
         return cb.Pool(
-            data=dataset.select(pl.exclude(["user_id", "age", "age_bucket", "is_male"])).to_pandas(),
+            data=self.to_data(dataset.select(pl.exclude(["user_id", "age", "age_bucket", "is_male"]))),
             **self.pool_params,
         )
 
@@ -111,7 +247,7 @@ class CatBoostCV:
             .select(pl.exclude(["user_id", "age", "age_bucket"]))
         )
         return cb.Pool(
-            data=dataset.select(pl.exclude("is_male")).to_pandas(),
+            data=self.to_data(dataset.select(pl.exclude("is_male"))),
             label=dataset["is_male"].to_pandas(),
             **self.pool_params,
         )
@@ -124,11 +260,99 @@ class CatBoostCV:
             .select(pl.exclude(["user_id", "is_male", "age"]))
         )
         return cb.Pool(
-            data=dataset.select(pl.exclude("age_bucket")).to_pandas(),
+            data=self.to_data(dataset.select(pl.exclude("age_bucket"))),
             label=dataset["age_bucket"].to_pandas(),
             **self.pool_params,
         )
 
+    def to_data(self, dataset: pl.DataFrame) -> pd.DataFrame:
+        # an unfitted model passes string categoricals as they are
+        encoder = getattr(self, "encoder_", None) or self.features_encoder()
+        return encoder(dataset)
+
+    def features_encoder(self) -> FeaturesEncoder:
+        return FeaturesEncoder(
+            cat_features=self.pool_params.get("cat_features"),
+            text_features=self.pool_params.get("text_features"),
+            embedding_features=self.pool_params.get("embedding_features"),
+        )
+
+    def quantizable(self) -> bool:
+        # catboost cannot train on quantized pools with text or embedding features
+        return not self.pool_params.get("text_features") and not self.pool_params.get("embedding_features")
+
+    def task_labels(self, dataset: pl.DataFrame) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        labels = {"sex": dataset["is_male"], "age": dataset["age_bucket"].clip_min(1)}
+        return {
+            task: (np.flatnonzero(label.is_not_null().to_numpy()), label.drop_nulls().to_numpy())
+            for task, label in labels.items()
+        }
+
+    def build_pools(self, train: pl.DataFrame, path: Optional[str | Path] = None) -> dict[str, cb.Pool]:
+        # one pool per task over its labeled rows, converted once and quantized with the border params
+        # from model_params; folds are slices of these pools
+        if path is not None:
+            metadata = self.pools_metadata(train)
+            if self.saved_pools_metadata(path) == metadata:
+                return self.load_pools(train, path)
+            if not self.quantizable():
+                raise ValueError("pools with text or embedding features are not quantized and cannot be saved")
+
+        self.encoder_ = self.features_encoder().fit(train)
+        data = self.encoder_(train.select(pl.exclude(["user_id", "age", "age_bucket", "is_male"])))
+        pools = {}
+        for task, (rows, label) in self.task_labels(train).items():
+            pools[task] = cb.Pool(data=data.iloc[rows], label=label, **self.pool_params)
+            if self.quantizable():
+                pools[task].quantize(**self.quantization_params())
+        del data
+
+        if path is not None:
+            Path(path).mkdir(parents=True, exist_ok=True)
+            for task, pool in pools.items():
+                pool.save(str(pool_file(path, task)))
+            self.encoder_.save(encoder_file(path))
+            # written last: pools without it are never reused
+            with open(pools_metadata_file(path), "w") as f:
+                json.dump(metadata, f, indent=2)
+        return pools
+
+    def load_pools(self, train: pl.DataFrame, path: str | Path) -> dict[str, cb.Pool]:
+        self.encoder_ = self.features_encoder().load(encoder_file(path))
+        pools = {}
+        for task, (rows, _) in self.task_labels(train).items():
+            pools[task] = cb.Pool(f"quantized://{pool_file(path, task)}")
+            if pools[task].num_row() != len(rows):
+                raise ValueError(
+                    f"{pool_file(path, task)} has {pools[task].num_row()} rows, train has {len(rows)} labeled rows"
+                )
+        return pools
+
+    def quantization_params(self) -> dict[str, Any]:
+        return {name: self.model_params[name] for name in QUANTIZATION_PARAMS if name in self.model_params}
+
+    def pools_metadata(self, train: pl.DataFrame) -> dict[str, Any]:
+        # saved pools are reused only for the same frame, features, pool params and borders
+        return json.loads(
+            json.dumps(
+                {
+                    "dataset": dataset_fingerprint(train),
+                    "columns": train.select(pl.exclude(["user_id", "age", "age_bucket", "is_male"])).columns,
+                    "pool_params": self.pool_params,
+                    "quantization_params": self.quantization_params(),
+                },
+                sort_keys=True,
+                default=repr,
+            )
+        )
+
+    def saved_pools_metadata(self, path: str | Path) -> Optional[dict[str, Any]]:
+        files = [pool_file(path, task) for task in TASKS] + [encoder_file(path), pools_metadata_file(path)]
+        if not all(file.exists() for file in files):
+            return None
+        with open(pools_metadata_file(path)) as f:
+            return json.load(f)
+
     def save_models(self, path: str | Path) -> None:
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
@@ -139,6 +363,7 @@ class CatBoostCV:
             model_age.save_model(str(fold_path / "age.cbm"))
         with open(path / "metrics.json", "w") as f:
             json.dump(self.metrics_, f)
+        self.encoder_.save(encoder_file(path))
 
     @classmethod
     def from_snapshot(cls, path: str | Path, **kwargs) -> CatBoostCV:
@@ -164,4 +389,31 @@ class CatBoostCV:
         model.models_sex_ = models_sex
         model.models_age_ = models_age
         model.metrics_ = metrics
+        # snapshots saved before the encoder were trained on strings
+        model.encoder_ = model.features_encoder()
+        if encoder_file(path).exists():
+            model.encoder_.load(encoder_file(path))
         return model
+
+
+def pool_file(path: str | Path, task: str) -> Path:
+    return Path(path) / f"{task}.quantized"
+
+
+def encoder_file(path: str | Path) -> Path:
+    return Path(path) / "categories.json"
+
+
+def pools_metadata_file(path: str | Path) -> Path:
+    return Path(path) / "pools.json"
+
+
+def fold_positions(rows: np.ndarray, train_idx: np.ndarray, val_idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # positions of the fold rows among the labeled rows a task pool is built from, in the splitter's order,
+    # so they line up with the fold frames train[train_idx] and train[val_idx]
+    train_idx, val_idx = np.asarray(train_idx), np.asarray(val_idx)
+    row_positions = np.full(max(rows.max(initial=-1), train_idx.max(initial=-1), val_idx.max(initial=-1)) + 1, -1)
+    row_positions[rows] = np.arange(len(rows))
+    train_positions, val_positions = row_positions[train_idx], row_positions[val_idx]
+    return train_positions[train_positions >= 0], val_positions[val_positions >= 0]
+
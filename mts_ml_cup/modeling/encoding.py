@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import polars as pl
+
+from mts_ml_cup.preprocessing.raw import encode_categories
+
+
+class FeaturesEncoder:
+    def __init__(
+        self,
+        cat_features: Optional[list[str]] = None,
+        text_features: Optional[list[str]] = None,
+        embedding_features: Optional[list[str]] = None,
+        categories: Optional[list[str]] = None,
+    ) -> None:
+        self.cat_features = set(cat_features or [])
+        self.text_features = set(text_features or [])
+        self.embedding_features = set(embedding_features or [])
+        self.set_categories(categories)
+
+    def fit(self, dataset: pl.DataFrame) -> FeaturesEncoder:
+        # one dictionary for all string categoricals: the 120 top-url columns share their values
+        string_features = [
+            name for name, dtype in dataset.schema.items() if name in self.cat_features and dtype == pl.Utf8
+        ]
+        self.set_categories(
+            pl.concat([dataset[name].unique() for name in string_features]).unique().drop_nulls().sort().to_list()
+            if string_features
+            else []
+        )
+        return self
+
+    def set_categories(self, categories: Optional[list[str]]) -> None:
+        # 0 is left for missing and unseen values; without categories strings are passed as they are
+        self.categories = categories
+        self.mapping = None if categories is None else dict(zip(categories, range(1, len(categories) + 1)))
+
+    def __call__(self, dataset: pl.DataFrame) -> pd.DataFrame:
+        # numerics are float32 numpy arrays (zero-copy when arrow already holds float32 without nulls),
+        # string categoricals are int32 codes, text stays a numpy array of str
+        columns = {}
+        for name, dtype in dataset.schema.items():
+            values = dataset[name]
+            if name in self.embedding_features:
+                columns[name] = values.to_pandas()
+            elif name in self.text_features:
+                columns[name] = values.to_numpy()
+            elif name in self.cat_features:
+                if dtype == pl.Utf8 and self.mapping is not None:
+                    values = encode_categories(values, self.mapping, pl.Int32).fill_null(0)
+                columns[name] = values.to_numpy()
+            else:
+                columns[name] = values.cast(pl.Float32).to_numpy()
+        return pd.DataFrame(columns, copy=False)
+
+    def save(self, path: str | Path) -> None:
+        with open(path, "w") as f:
+            json.dump({"categories": self.categories}, f)
+
+    def load(self, path: str | Path) -> FeaturesEncoder:
+        with open(path) as f:
+            self.set_categories(json.load(f)["categories"])
+        return self
@@ -1,45 +1,178 @@
 from __future__ import annotations
 
+import functools as ft
+import multiprocessing as mp
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
 
 import polars as pl
 from tqdm import tqdm
 
-from mts_ml_cup.utils import age_to_bucket, polars_map
-
-
-def find_unique_cat_variables(parts_path: str) -> list[set]:
-    regions = set()
-    cities = set()
-    manufacturers = set()
-    models = set()
-    types = set()
-    oss = set()
-    parts_of_day = set()
-
-    parts_path = "../data/raw/competition_data_final_pqt/"
-    for p in tqdm(os.listdir(parts_path)):
-        if not p.endswith(".parquet"):
-            continue
-        
-        part = (
-            pl.read_parquet(os.path.join(parts_path, p))
+from mts_ml_cup.utils import (
+    age_to_bucket,
+    bucket_path,
+    parquet_memory_size,
+    user_bucket,
+    weighted_mode_by_user,
+    workers_within_budget,
+)
+
+
+def list_parts(parts_path: str) -> list[str]:
+    return sorted(
+        os.path.join(parts_path, p)
+        for p in os.listdir(parts_path)
+        if p.endswith(".parquet")
+    )
+
+
+def find_unique_cat_variables(parts_path: str, as_mappings: bool = False) -> list[set] | list[dict[str, int]]:
+    values = find_unique_values(
+        parts_path,
+        [
+            pl.col("region_name"),
+            city_name_expr(),
+            pl.col("cpe_manufacturer_name"),
+            model_name_expr(),
+            pl.col("cpe_type_cd"),
+            pl.col("cpe_model_os_type"),
+            pl.col("part_of_day"),
+        ],
+    )
+    if as_mappings:
+        return [to_mapping(v) for v in values]
+    return values
+
+
+def find_unique_urls(parts_path: str, as_mapping: bool = False) -> set[str] | dict[str, int]:
+    urls = find_unique_values(parts_path, [pl.col("url_host")])[0]
+    if as_mapping:
+        return to_mapping(urls)
+    return urls
+
+
+def find_unique_values(parts_path: str, columns: list[pl.Expr]) -> list[set]:
+    parts = [
+        pl.scan_parquet(part_path)
+        .select(columns)
+        .select(pl.all().unique().list())
+        for part_path in list_parts(parts_path)
+    ]
+    uniques = pl.concat(pl.collect_all(parts))
+    return [set(uniques[col].explode()) for col in uniques.columns]
+
+
+def to_mapping(values: set[str]) -> dict[str, int]:
+    return dict(zip(sorted(values), range(1, len(values) + 1)))
+
+
+def city_name_expr() -> pl.Expr:
+    return pl.concat_str([pl.col("region_name"), pl.col("city_name")], sep="_+_").alias("city_name")
+
+
+def model_name_expr() -> pl.Expr:
+    return pl.concat_str([pl.col("cpe_manufacturer_name"), pl.col("cpe_model_name")], sep="_+_").alias("cpe_model_name")
+
+
+SESSIONS_COLUMNS = [
+    "region_id",
+    "city_id",
+    "manufacturer_id",
+    "model_id",
+    "type_id",
+    "os_id",
+    "url_id",
+    "price",
+    "date",
+    "part_of_day_id",
+    "request_cnt",
+    "user_id",
+]
+
+FACT_COLUMNS = [
+    "user_id",
+    "date",
+    "part_of_day_id",
+    "region_id",
+    "city_id",
+    "url_id",
+    "request_cnt",
+]
+
+DEVICE_COLUMNS = [
+    "manufacturer_id",
+    "model_id",
+    "type_id",
+    "os_id",
+    "price",
+]
+
+
+class SessionsEncoder:
+    def __init__(
+        self,
+        regions_mapping: dict[str, int],
+        cities_mapping: dict[str, int],
+        manufacturers_mapping: dict[str, int],
+        models_mapping: dict[str, int],
+        types_mapping: dict[str, int],
+        os_mapping: dict[str, int],
+        parts_of_day_mapping: dict[str, int],
+        urls_mapping: Optional[dict[str, int]] = None,
+    ) -> None:
+        self.encodings = [
+            ("region_name", "region_id", regions_mapping, pl.UInt8),
+            ("city_name", "city_id", cities_mapping, pl.UInt16),
+            ("cpe_manufacturer_name", "manufacturer_id", manufacturers_mapping, pl.UInt8),
+            ("cpe_model_name", "model_id", models_mapping, pl.UInt16),
+            ("cpe_type_cd", "type_id", types_mapping, pl.UInt8),
+            ("cpe_model_os_type", "os_id", os_mapping, pl.UInt8),
+            ("part_of_day", "part_of_day_id", parts_of_day_mapping, pl.UInt8),
+        ]
+        # without a urls mapping url_host stays a string, as in sessions converted before url_id
+        self.columns = SESSIONS_COLUMNS
+        if urls_mapping is not None:
+            self.encodings.append(("url_host", "url_id", urls_mapping, pl.UInt32))
+        else:
+            self.columns = [c if c != "url_id" else "url_host" for c in SESSIONS_COLUMNS]
+
+    def __call__(self, sessions: pl.DataFrame) -> pl.DataFrame:
+        return (
+            sessions
             .with_columns(
                 [
-                    pl.concat_str([pl.col("region_name"), pl.col("city_name")], sep="_+_").alias("city_name"),
-                    pl.concat_str([pl.col("cpe_manufacturer_name"), pl.col("cpe_model_name")], sep="_+_").alias("cpe_model_name"),
+                    city_name_expr(),
+                    model_name_expr(),
+                    pl.col("price").cast(pl.Float32),
+                    pl.col("request_cnt").cast(pl.UInt8),
+                    pl.col("user_id").cast(pl.UInt32),
                 ]
             )
+            .with_columns(
+                [
+                    pl.col(key_name)
+                    .map(ft.partial(encode_categories, mapping=mapping, id_dtype=id_dtype))
+                    .alias(id_name)
+                    for key_name, id_name, mapping, id_dtype in self.encodings
+                ]
+            )
+            .select(self.columns)
         )
-        regions |= set(part["region_name"].unique())
-        cities |= set(part["city_name"].unique())
-        manufacturers |= set(part["cpe_manufacturer_name"].unique())
-        models |= set(part["cpe_model_name"].unique())
-        types |= set(part["cpe_type_cd"].unique())
-        oss |= set(part["cpe_model_os_type"].unique())
-        parts_of_day |= set(part["part_of_day"].unique())
 
-    return regions, cities, manufacturers, models, types, oss, parts_of_day
+
+def encode_categories(values: pl.Series, mapping: dict[str, int], id_dtype: pl.DataType) -> pl.Series:
+    codes = values.cast(pl.Categorical)
+    # the lookup is built from real (code, value) pairs: under a global string cache codes are
+    # not positions in the arrow dictionary
+    present = codes.unique().drop_nulls()
+    physical = present.to_physical().to_list()
+    ids = [None] * (max(physical) + 1 if physical else 0)
+    for code, category in zip(physical, present.cast(pl.Utf8).to_list()):
+        ids[code] = mapping.get(category)
+    return pl.Series(values.name, ids, dtype=id_dtype).take(codes.to_physical())
 
 
 def convert_sessions(
@@ -51,70 +184,90 @@ def convert_sessions(
     types_mapping: dict[str, int],
     os_mapping: dict[str, int],
     parts_of_day_mapping: dict[str, int],
+    urls_mapping: Optional[dict[str, int]] = None,
 ) -> pl.DataFrame:
-    return (
-        sessions
-        .with_columns(
-            [
-                pl.concat_str([pl.col("region_name"), pl.col("city_name")], sep="_+_").alias("city_name"),
-                pl.concat_str([pl.col("cpe_manufacturer_name"), pl.col("cpe_model_name")], sep="_+_").alias("cpe_model_name"),
-                pl.col("price").cast(pl.Float32),
-                pl.col("request_cnt").cast(pl.UInt8),
-                pl.col("user_id").cast(pl.UInt32),
-            ]
-        )
-        .join(
-            other=polars_map(regions_mapping, "region_name", "region_id", pl.UInt8),
-            how="left",
-            on="region_name",
-        )
-        .join(
-            other=polars_map(cities_mapping, "city_name", "city_id", pl.UInt16),
-            how="left",
-            on="city_name",
-        )
-        .join(
-            other=polars_map(manufacturers_mapping, "cpe_manufacturer_name", "manufacturer_id", pl.UInt8),
-            how="left",
-            on="cpe_manufacturer_name",
-        )
-        .join(
-            other=polars_map(models_mapping, "cpe_model_name", "model_id", pl.UInt16),
-            how="left",
-            on="cpe_model_name",
-        )
-        .join(
-            other=polars_map(types_mapping, "cpe_type_cd", "type_id", pl.UInt8),
-            how="left",
-            on="cpe_type_cd",
-        )
-        .join(
-            other=polars_map(os_mapping, "cpe_model_os_type", "os_id", pl.UInt8),
-            how="left",
-            on="cpe_model_os_type",
-        )
-        .join(
-            other=polars_map(parts_of_day_mapping, "part_of_day", "part_of_day_id", pl.UInt8),
-            how="left",
-            on="part_of_day",
-        )
-        .select(
-            [
-                "region_id",
-                "city_id",
-                "manufacturer_id",
-                "model_id",
-                "type_id",
-                "os_id",
-                "url_host",
-                "price",
-                "date",
-                "part_of_day_id",
-                "request_cnt",
-                "user_id",
-            ]
-        )
+    encoder = SessionsEncoder(
+        regions_mapping=regions_mapping,
+        cities_mapping=cities_mapping,
+        manufacturers_mapping=manufacturers_mapping,
+        models_mapping=models_mapping,
+        types_mapping=types_mapping,
+        os_mapping=os_mapping,
+        parts_of_day_mapping=parts_of_day_mapping,
+        urls_mapping=urls_mapping,
     )
+    return encoder(sessions)
+
+
+def split_sessions(sessions: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
+    users_device = weighted_mode_by_user(sessions, DEVICE_COLUMNS).select(["user_id"] + DEVICE_COLUMNS)
+    return users_device.sort("user_id"), sessions.select(FACT_COLUMNS)
+
+
+def convert_sessions_parts(
+    parts_path: str,
+    output_path: str,
+    encoder: SessionsEncoder,
+    n_buckets: int = 64,
+    n_jobs: int = os.cpu_count(),
+    memory_budget: Optional[int] = None,
+) -> list[str]:
+    parts = list_parts(parts_path)
+    os.makedirs(os.path.join(output_path, "sessions"), exist_ok=True)
+    os.makedirs(os.path.join(output_path, "users_device"), exist_ok=True)
+    # a fresh directory per run, so leftovers of an interrupted run never get merged
+    tmp_path = tempfile.mkdtemp(prefix="_tmp-", dir=output_path)
+    parts_tmp_paths = [os.path.join(tmp_path, f"part-{i:05d}") for i in range(len(parts))]
+
+    n_workers = workers_within_budget(max(map(parquet_memory_size, parts)), n_jobs, memory_budget)
+    with ProcessPoolExecutor(n_workers, mp_context=mp.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(convert_part, part_path, part_tmp_path, encoder, n_buckets)
+            for part_path, part_tmp_path in zip(parts, parts_tmp_paths)
+        ]
+        for future in tqdm(futures, desc="convert parts"):
+            future.result()
+
+    buckets_tmp_paths = [
+        [bucket_path(part_tmp_path, bucket) for part_tmp_path in parts_tmp_paths]
+        for bucket in range(n_buckets)
+    ]
+    bucket_size = max(sum(map(parquet_memory_size, paths)) for paths in buckets_tmp_paths)
+
+    n_workers = workers_within_budget(bucket_size, n_jobs, memory_budget)
+    with ProcessPoolExecutor(n_workers, mp_context=mp.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(
+                merge_bucket,
+                paths,
+                bucket_path(os.path.join(output_path, "sessions"), bucket),
+                bucket_path(os.path.join(output_path, "users_device"), bucket),
+            )
+            for bucket, paths in enumerate(buckets_tmp_paths)
+        ]
+        buckets_paths = [future.result() for future in tqdm(futures, desc="sort buckets")]
+
+    shutil.rmtree(tmp_path)
+    return buckets_paths
+
+
+def convert_part(part_path: str, output_path: str, encoder: SessionsEncoder, n_buckets: int) -> None:
+    os.makedirs(output_path, exist_ok=True)
+    part = encoder(pl.read_parquet(part_path)).with_columns(user_bucket(n_buckets))
+    buckets = part.partition_by("bucket", as_dict=True)
+    for bucket in range(n_buckets):
+        (
+            buckets.get(bucket, part.head(0))
+            .drop("bucket")
+            .write_parquet(bucket_path(output_path, bucket))
+        )
+
+
+def merge_bucket(parts_paths: list[str], sessions_path: str, users_device_path: str) -> str:
+    users_device, sessions = split_sessions(pl.concat([pl.read_parquet(p) for p in parts_paths]).sort("user_id"))
+    users_device.write_parquet(users_device_path)
+    sessions.write_parquet(sessions_path)
+    return sessions_path
 
 
 def convert_train(train: pl.DataFrame) -> pl.DataFrame:
@@ -1,91 +1,133 @@
 from __future__ import annotations
 
+import hashlib
+import itertools as it
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
 import pandas as pd
 import pypdfium2 as pdfium
-from tqdm import tqdm
+
+STATS_COLUMNS = [
+    "age",
+    "men",
+    "women",
+    "urban_men",
+    "urban_women",
+    "rural_men",
+    "rural_women",
+]
 
 
 def parse_rosstat(
     path: str,
     start_page: int = 63,
     pages_per_region: int = 4,
+    n_jobs: int = os.cpu_count(),
+    cache_path: Optional[str] = None,
 ) -> pd.DataFrame:
+    path = os.path.expanduser(path)
+    if cache_path is not None:
+        cache_path = os.path.expanduser(cache_path)
+        cache_file = os.path.join(cache_path, f"rosstat-{pdf_fingerprint(path, start_page, pages_per_region)}.parquet")
+        if os.path.exists(cache_file):
+            return pd.read_parquet(cache_file)
+
+    n_pages = len(pdfium.PdfDocument(path))
+    first_pages = list(range(start_page, n_pages, pages_per_region))
+    n_chunks = max(1, min(n_jobs, len(first_pages)))
+    chunks = [chunk.tolist() for chunk in np.array_split(first_pages, n_chunks) if len(chunk)]
+    if len(chunks) > 1:
+        with ProcessPoolExecutor(len(chunks), mp_context=mp.get_context("spawn")) as pool:
+            regions_stats = list(
+                pool.map(parse_regions, [path] * len(chunks), chunks, [pages_per_region] * len(chunks))
+            )
+    else:
+        # spawning a worker costs more than a single chunk saves
+        regions_stats = [parse_regions(path, chunk, pages_per_region) for chunk in chunks]
+
+    stats = pd.DataFrame(
+        {
+            col: list(it.chain.from_iterable(region_stats[col] for region_stats in regions_stats))
+            for col in ["region"] + STATS_COLUMNS
+        }
+    )
+
+    if cache_path is not None:
+        os.makedirs(cache_path, exist_ok=True)
+        # written aside and moved in place: an interrupted write never leaves a truncated cache behind
+        stats.to_parquet(f"{cache_file}.tmp", index=False)
+        os.replace(f"{cache_file}.tmp", cache_file)
+    return stats
+
+
+def pdf_fingerprint(path: str, start_page: int, pages_per_region: int) -> str:
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            content_hash.update(block)
+    content_hash.update(f"{start_page}-{pages_per_region}".encode("utf-8"))
+    return content_hash.hexdigest()[:16]
+
+
+def parse_regions(path: str, first_pages: list[int], pages_per_region: int) -> dict[str, list]:
     rosstat = pdfium.PdfDocument(path)
-    regions_stats = []
-    for first_page_idx in tqdm(range(start_page, len(rosstat), pages_per_region)):
+    stats = {col: [] for col in ["region"] + STATS_COLUMNS}
+    for first_page_idx in first_pages:
         rosstat_region_pages = [rosstat[first_page_idx + offset] for offset in range(pages_per_region)]
-        region_stats = parse_region_stats(rosstat_region_pages)
-        regions_stats.append(region_stats)
-    return pd.concat(regions_stats).reset_index(drop=True)
+        for col, values in parse_region_stats(rosstat_region_pages).items():
+            stats[col].extend(values)
+    return stats
 
 
-def parse_region_stats(pages: list[pdfium.PdfPage]) -> pd.DataFrame:
+def parse_region_stats(pages: list[pdfium.PdfPage]) -> dict[str, list]:
     page_text_rows = [p.get_textpage().get_text_range().split("\n") for p in pages]
-    stats = pd.concat(
-        [
-            parse_first_page(page_text_rows[0]),
-            parse_middle_page(page_text_rows[1]),
-            parse_middle_page(page_text_rows[2]),
-            parse_last_page(page_text_rows[3]),
-        ]
-    ).reset_index(drop=True)
-    stats["region"] = parse_region_name(page_text_rows[0])
-    return stats.loc[
-        :, 
-        [
-            "region", "age", 
-            "men", "women", 
-            "urban_men", "urban_women", 
-            "rural_men", "rural_women",
-        ]
-    ]
-
-
-def parse_first_page(rows: list[str]) -> pd.DataFrame:
-    return parse_table(rows[10:-6])
-
-
-def parse_middle_page(rows: list[str]) -> pd.DataFrame:
-    return parse_table(rows[11:])
-
-
-def parse_last_page(rows: list[str]) -> pd.DataFrame:
-    stats = parse_table(rows[11:-6])
-    
+    stats = {col: [] for col in STATS_COLUMNS}
+    parse_first_page(page_text_rows[0], stats)
+    parse_middle_page(page_text_rows[1], stats)
+    parse_middle_page(page_text_rows[2], stats)
+    parse_last_page(page_text_rows[3], stats)
+    return {"region": [parse_region_name(page_text_rows[0])] * len(stats["age"]), **stats}
+
+
+def parse_first_page(rows: list[str], stats: dict[str, list[int]]) -> None:
+    parse_table(rows[10:-6], stats)
+
+
+def parse_middle_page(rows: list[str], stats: dict[str, list[int]]) -> None:
+    parse_table(rows[11:], stats)
+
+
+def parse_last_page(rows: list[str], stats: dict[str, list[int]]) -> None:
+    parse_table(rows[11:-6], stats)
+
     eighty_plus_values = rows[-6].split()
-    men = as_population(eighty_plus_values[4])
-    women = as_population(eighty_plus_values[5])
-    urban_men = as_population(eighty_plus_values[7])
-    urban_women = as_population(eighty_plus_values[8])
-    rural_men = as_population(eighty_plus_values[10])
-    rural_women = as_population(eighty_plus_values[11])
-    eighty_plus_stats = pd.DataFrame(
-        [[80, men, women, urban_men, urban_women, rural_men, rural_women]],
-        columns=stats.columns,
-    )
-    
-    return pd.concat([stats, eighty_plus_stats]).reset_index(drop=True)
+    stats["age"].append(80)
+    stats["men"].append(as_population(eighty_plus_values[4]))
+    stats["women"].append(as_population(eighty_plus_values[5]))
+    stats["urban_men"].append(as_population(eighty_plus_values[7]))
+    stats["urban_women"].append(as_population(eighty_plus_values[8]))
+    stats["rural_men"].append(as_population(eighty_plus_values[10]))
+    stats["rural_women"].append(as_population(eighty_plus_values[11]))
 
 
-def parse_table(rows: list[str]) -> pd.DataFrame:
-    stats = []
+def parse_table(rows: list[str], stats: dict[str, list[int]]) -> None:
     for row in rows:
         row_values = row.strip().split()
-        
+
         if row_values[1] == "–":
             continue
-        
-        age = int(row_values[0])
-        men = as_population(row_values[2])
-        women = as_population(row_values[3])
-        urban_men = as_population(row_values[5])
-        urban_women = as_population(row_values[6])
-        rural_men = as_population(row_values[8])
-        rural_women = as_population(row_values[9])
-        
-        stats.append([age, men, women, urban_men, urban_women, rural_men, rural_women])
 
-    return pd.DataFrame(stats, columns=["age", "men", "women", "urban_men", "urban_women", "rural_men", "rural_women"])
+        stats["age"].append(int(row_values[0]))
+        stats["men"].append(as_population(row_values[2]))
+        stats["women"].append(as_population(row_values[3]))
+        stats["urban_men"].append(as_population(row_values[5]))
+        stats["urban_women"].append(as_population(row_values[6]))
+        stats["rural_men"].append(as_population(row_values[8]))
+        stats["rural_women"].append(as_population(row_values[9]))
 
 
 def as_population(pop: str) -> int:
@@ -101,6 +143,6 @@ def parse_region_name(first_page_rows: list[str]) -> str:
 if __name__ == "__main__":
     from mts_ml_cup.utils import age_to_bucket
 
-    stats = parse_rosstat("~/mts-ml-cup/data/raw/rosstat.pdf")
+    stats = parse_rosstat("~/mts-ml-cup/data/raw/rosstat.pdf", cache_path="~/mts-ml-cup/data/cache")
     stats.insert(loc=2, column="age_bucket", value=stats["age"].apply(age_to_bucket))
     stats.to_csv("~/mts-ml-cup/data/processed/rosstat.csv", index=False)
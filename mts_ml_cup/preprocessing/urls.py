@@ -1,7 +1,16 @@
 from __future__ import annotations
 
+import functools as ft
+import hashlib
+import inspect
+import json
+import multiprocessing as mp
+import os
 import re
-from typing import Callable, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+import polars as pl
 
 
 def clean_url(
@@ -17,6 +26,260 @@ def clean_url(
     return url
 
 
+def build_urls_dimension(
+    urls_mapping: dict[str, int],
+    preprocessors: Optional[list[Callable[[str], str]]] = None,
+    protected: Optional[set[str]] = None,
+    cache_path: Optional[str] = None,
+) -> pl.DataFrame:
+    urls = (
+        pl.DataFrame(
+            {
+                "url_id": list(urls_mapping.values()),
+                "url_host": list(urls_mapping.keys()),
+            }
+        )
+        .with_columns(pl.col("url_id").cast(pl.UInt32))
+        .sort("url_id")
+    )
+    if cache_path is not None:
+        cleaned = CleanedUrlsCache(cache_path, preprocessors or [], protected=protected).clean(urls["url_host"])
+        urls = urls.join(cleaned, how="left", on="url_host")
+    else:
+        url_cleaner = VectorizedUrlCleaner(preprocessors or [], protected=protected)
+        urls = urls.with_columns(url_cleaner.expr("url_host").alias("url_cleaned"))
+    cleaned_ids = (
+        urls
+        .select("url_cleaned")
+        .unique()
+        .sort("url_cleaned")
+        .with_row_count("url_cleaned_id", offset=1)
+    )
+    return (
+        urls
+        .join(cleaned_ids, how="left", on="url_cleaned")
+        .select(["url_id", "url_host", "url_cleaned", "url_cleaned_id"])
+        .sort("url_id")
+    )
+
+
+def with_cleaned_url_ids(sessions: pl.DataFrame, urls: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
+    lookup = [None] * (urls["url_id"].max() + 1)
+    for url_id, url_cleaned_id in urls.select(["url_id", "url_cleaned_id"]).iter_rows():
+        lookup[url_id] = url_cleaned_id
+    lookup = pl.Series(lookup, dtype=pl.UInt32)
+    sessions = sessions.with_columns(pl.col("url_id").map(lambda url_ids: lookup.take(url_ids)))
+    cleaned_urls = (
+        urls
+        .select([pl.col("url_cleaned_id").alias("url_id"), pl.col("url_cleaned").alias("url_host")])
+        .unique()
+        .sort("url_id")
+    )
+    return sessions, cleaned_urls
+
+
+def clean_urls(
+    hosts: pl.Series | list[str],
+    preprocessors: list[Callable[[str], str]],
+    protected: Optional[set[str]] = None,
+    n_jobs: int = os.cpu_count(),
+    chunk_size: int = 50_000,
+) -> pl.DataFrame:
+    hosts = pl.Series("url_host", hosts, dtype=pl.Utf8).unique().sort()
+    if n_jobs == 1 or len(hosts) <= chunk_size:
+        return hosts.to_frame().with_columns(
+            VectorizedUrlCleaner(preprocessors, protected).expr("url_host").alias("url_cleaned")
+        )
+
+    chunks = [hosts[start:start + chunk_size] for start in range(0, len(hosts), chunk_size)]
+    with ProcessPoolExecutor(n_jobs, mp_context=mp.get_context("spawn")) as pool:
+        cleaned = list(pool.map(clean_urls_chunk, chunks, [preprocessors] * len(chunks), [protected] * len(chunks)))
+    return pl.DataFrame({"url_host": hosts, "url_cleaned": pl.concat(cleaned)})
+
+
+def clean_urls_chunk(
+    hosts: pl.Series,
+    preprocessors: list[Callable[[str], str]],
+    protected: Optional[set[str]] = None,
+) -> pl.Series:
+    return VectorizedUrlCleaner(preprocessors, protected)(hosts).alias("url_cleaned")
+
+
+class CleanedUrlsCache:
+    def __init__(
+        self,
+        path: str,
+        preprocessors: list[Callable[[str], str]],
+        protected: Optional[set[str]] = None,
+        n_jobs: int = 1,
+    ) -> None:
+        self.path = path
+        self.preprocessors = preprocessors
+        self.protected = protected
+        self.n_jobs = n_jobs
+        self.fingerprint = preprocessors_fingerprint(preprocessors, protected)
+
+    @property
+    def cache_file(self) -> str:
+        return os.path.join(self.path, f"{self.fingerprint}.parquet")
+
+    def load(self) -> pl.DataFrame:
+        if not os.path.exists(self.cache_file):
+            return pl.DataFrame(schema={"url_host": pl.Utf8, "url_cleaned": pl.Utf8})
+        return pl.read_parquet(self.cache_file)
+
+    def clean(self, hosts: pl.Series) -> pl.DataFrame:
+        hosts = hosts.unique().alias("url_host").to_frame()
+        cached = self.load()
+        new_hosts = hosts.join(cached, how="anti", on="url_host")["url_host"]
+        if len(new_hosts) > 0:
+            cleaned = clean_urls(new_hosts, self.preprocessors, self.protected, n_jobs=self.n_jobs)
+            cached = pl.concat([cached, cleaned])
+            self.save(cached)
+        return hosts.join(cached, how="left", on="url_host")
+
+    def save(self, cleaned: pl.DataFrame) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        tmp_file = f"{self.cache_file}.tmp"
+        cleaned.write_parquet(tmp_file)
+        os.replace(tmp_file, self.cache_file)
+
+
+def preprocessors_fingerprint(
+    preprocessors: list[Callable[[str], str]],
+    protected: Optional[set[str]] = None,
+) -> str:
+    description = {
+        "preprocessors": [describe_preprocessor(preprocessor) for preprocessor in preprocessors],
+        "protected": sorted(protected or set()),
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def describe_preprocessor(preprocessor: Callable[[str], str]) -> dict[str, Any]:
+    func, args, kwargs = preprocessor, (), {}
+    if isinstance(preprocessor, ft.partial):
+        func, args, kwargs = preprocessor.func, preprocessor.args, preprocessor.keywords
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = None
+    return {
+        "name": f"{getattr(func, '__module__', None)}.{getattr(func, '__qualname__', repr(func))}",
+        "source": source,
+        "args": [canonical_param(arg) for arg in args],
+        "kwargs": {name: canonical_param(value) for name, value in kwargs.items()},
+    }
+
+
+def canonical_param(value: Any) -> Any:
+    if isinstance(value, dict):
+        return sorted([canonical_param(k), canonical_param(v)] for k, v in value.items())
+    if isinstance(value, (set, frozenset)):
+        return sorted(canonical_param(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [canonical_param(v) for v in value]
+    if isinstance(value, (SuffixMatcher, EntryMatcher)):
+        return {"matcher": type(value).__name__, "rules": value.rules}
+    if isinstance(value, re.Pattern):
+        return {"pattern": value.pattern, "flags": value.flags}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+class SuffixMatcher:
+    def __init__(self, suffixes: list[str]) -> None:
+        self.rules = list(suffixes)
+        self.trie = {}
+        self.root_rule = None
+        for i, suffix in reversed(list(enumerate(self.rules))):
+            if not suffix:
+                self.root_rule = i
+                continue
+            node = self.trie
+            for char in reversed(suffix):
+                node = node.setdefault(char, {})
+            node[None] = i
+
+    def match(self, url: str) -> Optional[str]:
+        best = self.root_rule
+        node = self.trie
+        for char in reversed(url):
+            node = node.get(char)
+            if node is None:
+                break
+            rule = node.get(None)
+            if rule is not None and (best is None or rule < best):
+                best = rule
+        return None if best is None else self.rules[best]
+
+
+class EntryMatcher:
+    def __init__(self, entries: list[str]) -> None:
+        self.rules = list(entries)
+        self.goto = [{}]
+        self.rule = [None]
+        for i, entry in enumerate(self.rules):
+            state = 0
+            for char in entry:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.rule.append(None)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            if self.rule[state] is None:
+                self.rule[state] = i
+
+        # breadth-first pass: failure links plus the best (first in list) rule reachable through them
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail][char] if char in self.goto[fail] else 0
+                self.rule[next_state] = min_rule(self.rule[next_state], self.rule[self.fail[next_state]])
+                queue.append(next_state)
+
+    def match(self, url: str) -> Optional[str]:
+        best = self.rule[0]
+        state = 0
+        for char in url:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            best = min_rule(best, self.rule[state])
+        return None if best is None else self.rules[best]
+
+
+def min_rule(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+def first_suffix(url: str, suffixes: list[str] | SuffixMatcher) -> Optional[str]:
+    if isinstance(suffixes, SuffixMatcher):
+        return suffixes.match(url)
+    for suffix in suffixes:
+        if url.endswith(suffix):
+            return suffix
+    return None
+
+
+def first_entry(url: str, entries: list[str] | EntryMatcher) -> Optional[str]:
+    if isinstance(entries, EntryMatcher):
+        return entries.match(url)
+    for entry in entries:
+        if entry in url:
+            return entry
+    return None
+
+
 def decode_from_punycode(url: str) -> str:
     try:
         return bytearray(url, "utf-8").decode("idna")
@@ -32,11 +295,11 @@ def replace_hyphens_with_dots(url: str) -> str:
     return ".".join(filter(lambda p: p != "", url.split("-")))
 
 
-def remove_page_accelerator(url: str, accelerators: list[str]) -> str:
-    for accelerator in accelerators:
-        if url.endswith(accelerator):
-            return ".".join(url[:-len(accelerator)].split("-"))
-    return url
+def remove_page_accelerator(url: str, accelerators: list[str] | SuffixMatcher) -> str:
+    accelerator = first_suffix(url, accelerators)
+    if accelerator is None:
+        return url
+    return ".".join(url[:-len(accelerator)].split("-"))
 
 
 def remove_char(url: str, chars: list[str]) -> str:
@@ -45,11 +308,11 @@ def remove_char(url: str, chars: list[str]) -> str:
     return url
 
 
-def save_only_suffix(url: str, suffixes: list[str]) -> str:
-    for suffix in suffixes:
-        if url.endswith(suffix):
-            return suffix
-    return url
+def save_only_suffix(url: str, suffixes: list[str] | SuffixMatcher) -> str:
+    suffix = first_suffix(url, suffixes)
+    if suffix is None:
+        return url
+    return suffix
 
 
 def remove_first_level_domain(url: str) -> str:
@@ -62,15 +325,15 @@ def remove_one_char_domains(url: str) -> str:
     return ".".join(filter(lambda domain: len(domain) > 1, url.split(".")))
 
 
-def remove_domains(url: str, domains: list[str]) -> str:
+def remove_domains(url: str, domains: list[str] | frozenset[str]) -> str:
     return ".".join(filter(lambda domain: domain not in domains, url.split(".")))
 
 
-def save_full_entry(url: str, entries: list[str]) -> str:
-    for entry in entries:
-        if entry in url:
-            return entry
-    return url
+def save_full_entry(url: str, entries: list[str] | EntryMatcher) -> str:
+    entry = first_entry(url, entries)
+    if entry is None:
+        return url
+    return entry
 
 
 def map_url(url: str, mapping: dict[str, str]) -> str:
@@ -79,3 +342,157 @@ def map_url(url: str, mapping: dict[str, str]) -> str:
 
 def save_regexp(url: str, pattern: re.Pattern = re.compile("[a-zA-Zа-яА-Я]+")) -> str:
     return "".join(part for part in pattern.findall(url))
+
+
+class VectorizedUrlCleaner:
+    def __init__(
+        self,
+        preprocessors: list[Callable[[str], str]],
+        protected: Optional[set[str]] = None,
+    ) -> None:
+        self.preprocessors = preprocessors
+        self.protected = sorted(protected or set())
+        self.steps = [compile_preprocessor(preprocessor) for preprocessor in preprocessors]
+
+    def __call__(self, urls: pl.Series) -> pl.Series:
+        url = pl.col("url")
+        cleaned = urls.to_frame("url")
+        for step in self.steps:
+            step = step(url)
+            if self.protected:
+                step = pl.when(url.is_in(self.protected)).then(url).otherwise(step)
+            cleaned = cleaned.with_columns(step.alias("url"))
+        return cleaned["url"].alias(urls.name)
+
+    def expr(self, column: str) -> pl.Expr:
+        return pl.col(column).map(self, return_dtype=pl.Utf8)
+
+
+def compile_preprocessor(preprocessor: Callable[[str], str]) -> Callable[[pl.Expr], pl.Expr]:
+    func, args, kwargs = preprocessor, (), {}
+    if isinstance(preprocessor, ft.partial):
+        func, args, kwargs = preprocessor.func, preprocessor.args, preprocessor.keywords
+
+    if func not in VECTORIZED_PREPROCESSORS:
+        return lambda url: url.apply(preprocessor, return_dtype=pl.Utf8)
+
+    params = inspect.signature(func).bind(None, *args, **kwargs)
+    params.apply_defaults()
+    params = dict(list(params.arguments.items())[1:])
+    # compiled matchers exist for rule lists too long for when/then chains, so they stay on the python path
+    if any(isinstance(param, (SuffixMatcher, EntryMatcher)) for param in params.values()):
+        return lambda url: url.apply(preprocessor, return_dtype=pl.Utf8)
+    return VECTORIZED_PREPROCESSORS[func](**params)
+
+
+def vectorized_lower() -> Callable[[pl.Expr], pl.Expr]:
+    return lambda url: url.str.to_lowercase()
+
+
+def vectorized_replace_hyphens_with_dots() -> Callable[[pl.Expr], pl.Expr]:
+    return lambda url: url.str.replace_all("^-+|-+$", "").str.replace_all("-+", ".")
+
+
+def vectorized_remove_page_accelerator(accelerators: list[str]) -> Callable[[pl.Expr], pl.Expr]:
+    def step(url: pl.Expr) -> pl.Expr:
+        if not accelerators:
+            return url
+        # url[:-0] is an empty string, so an empty accelerator wipes the url just like the python version
+        stripped = [
+            url.str.replace(f"{escape_regex(accelerator)}$", "").str.replace_all("-", ".", literal=True)
+            if accelerator
+            else pl.lit("")
+            for accelerator in accelerators
+        ]
+        cleaned = pl.when(url.str.ends_with(accelerators[0])).then(stripped[0])
+        for accelerator, accelerator_stripped in zip(accelerators[1:], stripped[1:]):
+            cleaned = cleaned.when(url.str.ends_with(accelerator)).then(accelerator_stripped)
+        return cleaned.otherwise(url)
+    return step
+
+
+def escape_regex(pattern: str) -> str:
+    return "".join(f"\\{char}" if char in REGEX_META_CHARACTERS else char for char in pattern)
+
+
+def vectorized_remove_char(chars: list[str]) -> Callable[[pl.Expr], pl.Expr]:
+    def step(url: pl.Expr) -> pl.Expr:
+        for char in chars:
+            if char:
+                url = url.str.replace_all(char, "", literal=True)
+        return url
+    return step
+
+
+def vectorized_save_only_suffix(suffixes: list[str]) -> Callable[[pl.Expr], pl.Expr]:
+    return vectorized_first_match(suffixes, lambda url, suffix: url.str.ends_with(suffix))
+
+
+def vectorized_save_full_entry(entries: list[str]) -> Callable[[pl.Expr], pl.Expr]:
+    return vectorized_first_match(entries, lambda url, entry: url.str.contains(entry, literal=True))
+
+
+def vectorized_first_match(
+    patterns: list[str],
+    matches: Callable[[pl.Expr, str], pl.Expr],
+) -> Callable[[pl.Expr], pl.Expr]:
+    def step(url: pl.Expr) -> pl.Expr:
+        if not patterns:
+            return url
+        cleaned = pl.when(matches(url, patterns[0])).then(pl.lit(patterns[0]))
+        for pattern in patterns[1:]:
+            cleaned = cleaned.when(matches(url, pattern)).then(pl.lit(pattern))
+        return cleaned.otherwise(url)
+    return step
+
+
+def vectorized_remove_first_level_domain() -> Callable[[pl.Expr], pl.Expr]:
+    return lambda url: url.str.replace(r"\.[^.]*$", "")
+
+
+def vectorized_remove_one_char_domains() -> Callable[[pl.Expr], pl.Expr]:
+    return lambda url: (
+        url.str.split(".")
+        .arr.eval(pl.element().filter(pl.element().str.n_chars() > 1))
+        .arr.join(".")
+    )
+
+
+def vectorized_remove_domains(domains: list[str]) -> Callable[[pl.Expr], pl.Expr]:
+    domains = list(domains)
+    return lambda url: (
+        url.str.split(".")
+        .arr.eval(pl.element().filter(~pl.element().is_in(domains)))
+        .arr.join(".")
+    )
+
+
+def vectorized_map_url(mapping: dict[str, str]) -> Callable[[pl.Expr], pl.Expr]:
+    mapping = {url: mapped_url for url, mapped_url in mapping.items() if mapped_url}
+    return lambda url: url.map_dict(mapping, default=pl.first())
+
+
+def vectorized_save_regexp(pattern: re.Pattern) -> Callable[[pl.Expr], pl.Expr]:
+    if pattern.groups or pattern.flags & ~re.UNICODE:
+        return lambda url: url.apply(ft.partial(save_regexp, pattern=pattern), return_dtype=pl.Utf8)
+    return lambda url: (
+        pl.when(url.is_not_null())
+        .then(url.str.extract_all(pattern.pattern).arr.join("").fill_null(""))
+    )
+
+
+REGEX_META_CHARACTERS = set("\\.+*?()|[]{}^$#&-~")
+
+VECTORIZED_PREPROCESSORS = {
+    lower: vectorized_lower,
+    replace_hyphens_with_dots: vectorized_replace_hyphens_with_dots,
+    remove_page_accelerator: vectorized_remove_page_accelerator,
+    remove_char: vectorized_remove_char,
+    save_only_suffix: vectorized_save_only_suffix,
+    remove_first_level_domain: vectorized_remove_first_level_domain,
+    remove_one_char_domains: vectorized_remove_one_char_domains,
+    remove_domains: vectorized_remove_domains,
+    save_full_entry: vectorized_save_full_entry,
+    map_url: vectorized_map_url,
+    save_regexp: vectorized_save_regexp,
+}
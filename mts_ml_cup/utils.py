@@ -1,9 +1,15 @@
 from __future__ import annotations
 
 import bisect
+import hashlib
+import json
+import os
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 import polars as pl
+import pyarrow.parquet as pq
 
 
 def age_to_bucket(age: int) -> int:
@@ -24,3 +30,149 @@ def polars_map(
         )
         .with_columns(pl.col(id_name).cast(id_dtype))
     )
+
+
+def lazy_like(frame: pl.DataFrame | pl.LazyFrame, other: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return frame.lazy() if isinstance(other, pl.LazyFrame) else frame
+
+
+def scan_dataset(path: str) -> pl.LazyFrame:
+    path = os.path.expanduser(path)
+    return pl.scan_parquet(os.path.join(path, "*.parquet") if os.path.isdir(path) else path)
+
+
+def dataset_fingerprint(data: str | pl.DataFrame | pl.LazyFrame) -> str:
+    data_hash = hashlib.sha256()
+    if isinstance(data, str):
+        path = os.path.expanduser(data)
+        paths = [path]
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".parquet"))
+        for file_path in paths:
+            data_hash.update(os.path.basename(file_path).encode("utf-8"))
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    data_hash.update(block)
+    else:
+        data = data.collect() if isinstance(data, pl.LazyFrame) else data
+        data_hash.update(json.dumps({col: str(dtype) for col, dtype in data.schema.items()}).encode("utf-8"))
+        data_hash.update(data.hash_rows(seed=0).to_numpy().tobytes())
+    return data_hash.hexdigest()[:16]
+
+
+KEY_BITS = {"date": 29, "part_of_day_id": 3, "url_id": 32, "region_id": 8, "city_id": 16, "user_id": 32}
+
+
+def packed_key(columns: list[str], bits: dict[str, int] = KEY_BITS) -> pl.Expr:
+    # (date, part_of_day_id, url_id) -> (date_ordinal + 1 << 35) | (part_of_day_id + 1 << 32) | url_id + 1,
+    # a null component is 0, so nulls stay distinct values and never make the whole key null
+    if sum(bits[col] for col in columns) > 64:
+        raise ValueError(f"{columns} do not fit into a 64-bit key")
+    key = pl.lit(0, dtype=pl.UInt64)
+    for col in columns:
+        # a bare fill_null(0) makes polars 0.16 coerce the whole key to Float64
+        component = (pl.col(col).to_physical().cast(pl.UInt64) + pl.lit(1, dtype=pl.UInt64)).fill_null(
+            pl.lit(0, dtype=pl.UInt64)
+        )
+        key = key * pl.lit(1 << bits[col], dtype=pl.UInt64) + component
+    return key.alias("_".join(columns))
+
+
+def unpacked_columns(
+    key: str,
+    columns: list[str],
+    dtypes: dict[str, pl.DataType],
+    bits: dict[str, int] = KEY_BITS,
+) -> list[pl.Expr]:
+    exprs, shift = [], 0
+    for col in reversed(columns):
+        component = (pl.col(key) // pl.lit(1 << shift, dtype=pl.UInt64)) % pl.lit(1 << bits[col], dtype=pl.UInt64)
+        value = pl.when(component == 0).then(None).otherwise(component - pl.lit(1, dtype=pl.UInt64))
+        if dtypes[col] == pl.Date:
+            value = value.cast(pl.Int32)
+        exprs.append(value.cast(dtypes[col]).alias(col))
+        shift += bits[col]
+    return exprs[::-1]
+
+
+def save_arrays(path: str, arrays: dict[str, np.ndarray]) -> None:
+    # one .npy per array, written through a memmap, so each can be mapped back without reading the rest
+    os.makedirs(path, exist_ok=True)
+    for name, values in arrays.items():
+        values = np.asarray(values)
+        memmap = np.lib.format.open_memmap(
+            os.path.join(path, f"{name}.npy"), mode="w+", dtype=values.dtype, shape=values.shape
+        )
+        memmap[:] = values
+        memmap.flush()
+
+
+def load_arrays(path: str, names: list[str], mmap_mode: Optional[str] = "r") -> tuple[np.ndarray, ...]:
+    return tuple(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in names)
+
+
+def user_bucket(n_buckets: int) -> pl.Expr:
+    return (pl.col("user_id") % n_buckets).cast(pl.UInt32).alias("bucket")
+
+
+def bucket_path(path: str, bucket: int) -> str:
+    return os.path.join(path, f"bucket-{bucket:04d}.parquet")
+
+
+def parquet_memory_size(path: str) -> int:
+    metadata = pq.read_metadata(path)
+    return sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+
+
+def workers_within_budget(unit_size: int, n_jobs: int, memory_budget: Optional[int] = None) -> int:
+    if memory_budget is None:
+        return n_jobs
+    return max(1, min(n_jobs, memory_budget // max(unit_size, 1)))
+
+
+def weighted_mode_by_user(
+    sessions: pl.DataFrame | pl.LazyFrame,
+    columns: list[str],
+    weight: str = "request_cnt",
+) -> pl.DataFrame | pl.LazyFrame:
+    # one pass over the sessions: the (user, *columns) cube is grouped once and every mode is taken
+    # from it; ties go to the largest value, same as sorting by (weight, value) and taking the last row
+    key_columns = ["user_id", *columns]
+    if all(col in KEY_BITS for col in key_columns) and sum(KEY_BITS[col] for col in key_columns) <= 64:
+        # a single packed key groups about twice as fast as several key columns
+        key = packed_key(key_columns)
+        cube = (
+            sessions
+            .lazy()
+            .groupby(key)
+            .agg(pl.col(weight).sum())
+            .select([*unpacked_columns(key.meta.output_name(), key_columns, sessions.schema), weight])
+        )
+    else:
+        cube = sessions.lazy().groupby(["user_id", *columns]).agg(pl.col(weight).sum())
+    if isinstance(sessions, pl.DataFrame):
+        cube = cube.collect().lazy()
+    else:
+        cube = cube.cache()
+    plans = [
+        cube
+        .groupby(["user_id", col])
+        .agg(pl.col(weight).sum())
+        .groupby("user_id")
+        .agg(
+            [
+                # filter(...).max() picks wrong values in 0.16 once the column holds nulls;
+                # sort_by keeps the sort-then-last() tie-break with nulls sorted first
+                pl.col(col).sort_by([weight, col]).last().alias(col),
+                (pl.col(weight).max() / pl.col(weight).sum()).alias(f"{col}_share"),
+                pl.col(col).n_unique().alias(f"{col}_n_unique"),
+            ]
+        )
+        for col in columns
+    ]
+    if isinstance(sessions, pl.DataFrame):
+        plans = pl.collect_all(plans)
+    modes, *other_modes = plans
+    for col_modes in other_modes:
+        modes = modes.join(col_modes, how="left", on="user_id")
+    return modes